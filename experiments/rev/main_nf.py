@@ -10,7 +10,7 @@ import json
 
 from yafs.core import Sim
 from yafs.application import Application, Message
-from yafs.topology_old import Topology
+from yafs.topology import Topology
 from yafs.placement import JSONPlacement, JSONPlacementOnCloud
 from yafs.distribution import deterministic_distribution
 import numpy as np
@@ -80,13 +80,9 @@ It returns the software modules (a list of identifiers of DES process) deployed
 
 
 def getProcessFromThatNode(sim, node_to_remove):
-    if node_to_remove in sim.alloc_DES.values():
-        DES = []
+    if node_to_remove in sim.node_DES:
         # This node can have multiples DES processes on itself
-        for k, v in sim.alloc_DES.items():
-            if v == node_to_remove:
-                DES.append(k)
-        return DES, True
+        return sorted(sim.node_DES[node_to_remove]), True
     else:
         return [], False
 
@@ -118,9 +114,8 @@ def failureControl(sim, filelog, ids):
             #     if des in sim.alloc_source.keys():
             #         print "Removing a Gtw/User entity\t"*4
 
+            # All the DES processes of the node are stopped and removed with it
             sim.remove_node(node_to_remove)
-            for key in keys_DES:
-                sim.stop_process(key)
         except IndexError:
             None
 
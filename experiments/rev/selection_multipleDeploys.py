@@ -1,57 +1,102 @@
 from yafs.selection import Selection
 from yafs.topology import Topology
 import networkx as nx
+import numpy as np
 
 
 class DeviceSpeedAwareRouting(Selection):
     def __init__(self):
         self.cache = {}
-        self.invalid_cache_value = -1
-        self.previous_number_of_nodes = -1
+        # (node_src, DES_dst) -> (path, des)
+        self.cache_by_node = {}
+        # node -> keys of the cache whose path goes through it
+        self.cache_by_des = {}
+        # DES -> keys of the cache that include it as a target
+        self.version = 0
+        # The version of the simulation that the cache reflects, see Sim.get_changes
+        self.link_weights = {}
+        # message size -> weight function of the links
         super(DeviceSpeedAwareRouting, self).__init__()
 
+    def link_weight(self, size):
+        """
+        Returns the transmission time of a message of that size through each link: PR + size/BW.
+        The function is reused for each size so the routing table keeps one tree by source and size.
+        """
+        if size not in self.link_weights:
+            self.link_weights[size] = (
+                lambda src, dst, att: att[Topology.LINK_PR] + size / att[Topology.LINK_BW]
+            )
+        return self.link_weights[size]
+
     def compute_DSAR(self, node_src, alloc_DES, sim, DES_dst, message):
+        if not DES_dst:
+            return [], []
         try:
-            bestSpeed = float("inf")
-            minPath = []
-            bestDES = []
-            # print len(DES_dst)
-            for dev in DES_dst:
-                # print "DES :",dev
-                node_dst = alloc_DES[dev]
-                path = list(
-                    nx.shortest_path(sim.topology.G, source=node_src, target=node_dst)
-                )
-                speed = 0
-                for i in range(len(path) - 1):
-                    link = (path[i], path[i + 1])
-                    # print "LINK : ",link
-                    # print " BYTES :", message.bytes
-                    speed += sim.topology.G.edges[link][Topology.LINK_PR] + (
-                        message.bytes / sim.topology.G.edges[link][Topology.LINK_BW]
-                    )
-                    # print sim.topology.G.edges[link][Topology.LINK_BW]
-
-                att_node = sim.topology.get_nodes_att()[path[-1]]
-
-                time_service = message.inst / float(att_node["IPT"])
-                speed += time_service  # HW - computation of last node
-                # print "SPEED: ",speed
-                if speed < bestSpeed:
-                    bestSpeed = speed
-                    minPath = path
-                    bestDES = dev
-
-            # print bestDES,minPath
+            # One Dijkstra from the source gives the network time to every node
+            routing = sim.topology.get_routing_table()
+            weight = self.link_weight(message.bytes)
+            distance = routing.get_distances(node_src, weight)
+
+            nodes = [alloc_DES[dev] for dev in DES_dst]
+            att_node = sim.topology.get_nodes_att()
+            network = np.array([distance.get(node, np.inf) for node in nodes])
+            ipt = np.array([float(att_node[node]["IPT"]) for node in nodes])
+            speed = network + message.inst / ipt  # HW - computation of last node
+
+            best = int(np.argmin(speed))
+            if not np.isfinite(speed[best]):
+                raise nx.NetworkXNoPath()
+            minPath = routing.get_path(node_src, nodes[best], weight)
+            bestDES = DES_dst[best]
             return minPath, bestDES
 
         except (nx.NetworkXNoPath, nx.NodeNotFound) as e:
             self.logger.warning(
-                "There is no path between two nodes: %s - %s " % (node_src, node_dst)
+                "There is no path between two nodes: %s - %s " % (node_src, DES_dst)
             )
             # print "Simulation ends?"
             return [], None
 
+    def evict(self, key):
+        path, des = self.cache.pop(key)
+        for node in path:
+            self.cache_by_node.get(node, set()).discard(key)
+        for dev in key[1]:
+            self.cache_by_des.get(dev, set()).discard(key)
+
+    def store(self, key, value):
+        self.cache[key] = value
+        for node in value[0]:
+            self.cache_by_node.setdefault(node, set()).add(key)
+        for dev in key[1]:
+            self.cache_by_des.setdefault(dev, set()).add(key)
+
+    def update_cache(self, sim):
+        """
+        Evicts only the routes affected by the changes of the simulation since the last call.
+        Removing nodes or links does not shorten any path, so a route that avoids them is still the best one.
+        """
+        for kind, value in sim.get_changes(self.version):
+            if kind == sim.CHANGE_REMOVE_NODE:
+                stale = set(self.cache_by_node.pop(value, ()))
+            elif kind == sim.CHANGE_REMOVE_LINK:
+                src, dst = value
+                stale = set()
+                for key in self.cache_by_node.get(src, set()) & self.cache_by_node.get(dst, set()):
+                    path = self.cache[key][0]
+                    if any({path[i], path[i + 1]} == {src, dst} for i in range(len(path) - 1)):
+                        stale.add(key)
+            elif kind in (sim.CHANGE_DEPLOY, sim.CHANGE_UNDEPLOY):
+                stale = set(self.cache_by_des.pop(value[2], ()))
+            else:
+                # A new link or node can shorten any path
+                stale = set(self.cache)
+            for key in stale:
+                if key in self.cache:
+                    self.evict(key)
+        self.version = sim.version
+
     def get_path(
         self,
         sim,
@@ -71,18 +116,16 @@ class DeviceSpeedAwareRouting(Selection):
 
         # print "Enrouting from SRC: %i  -<->- DES %s"%(node_src,DES_dst)
 
-        # The number of nodes control the updating of the cache. If the number of nodes changes, the cache is totally cleaned.
-        currentNodes = len(sim.topology.G.nodes)
-        if not self.invalid_cache_value == currentNodes:
-            self.invalid_cache_value = currentNodes
-            self.cache = {}
+        if self.version != sim.version:
+            self.update_cache(sim)
 
-        if (node_src, tuple(DES_dst)) not in self.cache.keys():
-            self.cache[node_src, tuple(DES_dst)] = self.compute_DSAR(
-                node_src, alloc_DES, sim, DES_dst, message
+        key = (node_src, tuple(DES_dst))
+        if key not in self.cache:
+            self.store(
+                key, self.compute_DSAR(node_src, alloc_DES, sim, DES_dst, message)
             )
 
-        path, des = self.cache[node_src, tuple(DES_dst)]
+        path, des = self.cache[key]
 
         return [path], [des]
 
@@ -94,21 +137,28 @@ class DeviceSpeedAwareRouting(Selection):
         # print message.dst_int  # 301
         # print link #(130, 301) link is broken! 301 is unreacheble
 
-        idx = message.path.index(link[0])
-        # print "IDX: ",idx
-        if idx == len(message.path):
-            # The node who serves ... not possible case
-            return [], []
-        else:
-            node_src = message.path[
-                idx
-            ]  # In this point to the other entity the system fail
-            # print "SRC: ",node_src # 164
-
-            node_dst = message.path[len(message.path) - 1]
-            # print "DST: ",node_dst #261
-            # print "INT: ",message.dst_int #301
-
+        # The hop cursor points to the unreachable entity: link[1]
+        idx = message.hop - 1
+        node_src = message.path[idx]  # In this point to the other entity the system fail
+        # print "SRC: ",node_src # 164
+
+        # The message keeps its destination if it is still reachable: the detour comes from the tree of that node, shared by all the messages towards it
+        path, des = [], []
+        if message.idDES in alloc_DES:
+            try:
+                routing = sim.topology.get_routing_table()
+                path = [
+                    routing.get_path_towards(
+                        node_src,
+                        alloc_DES[message.idDES],
+                        self.link_weight(message.bytes),
+                    )
+                ]
+                des = [message.idDES]
+            except (nx.NetworkXNoPath, nx.NodeNotFound):
+                path = []
+        if not path:
+            # Otherwise, another replica is chosen
             path, des = self.get_path(
                 sim,
                 message.app_name,
@@ -119,16 +169,15 @@ class DeviceSpeedAwareRouting(Selection):
                 traffic,
                 from_des,
             )
-            if len(path[0]) > 0:
-                # print path # [[164, 130, 380, 110, 216]]
-                # print des # [40]
-
-                concPath = message.path[0 : message.path.index(path[0][0])] + path[0]
-                # print concPath # [86, 242, 160, 164, 130, 380, 110, 216]
-                newINT = node_src  # path[0][2]
-                # print newINT # 380
-
-                message.dst_int = newINT
-                return [concPath], des
-            else:
-                return [], []
+        if path and len(path[0]) > 0:
+            # print path # [[164, 130, 380, 110, 216]]
+            # print des # [40]
+
+            # The new route starts in node_src, so the cursor is rewritten to its position
+            concPath = message.path[0:idx] + path[0]
+            # print concPath # [86, 242, 160, 164, 130, 380, 110, 216]
+            message.hop = idx
+            message.dst_int = node_src
+            return [concPath], des
+        else:
+            return [], []
@@ -0,0 +1,111 @@
+import contextlib
+import io
+import random
+
+import numpy as np
+import pytest
+
+from yafs.application import Application, Message
+from yafs.core import Sim
+from yafs.distribution import deterministic_distribution
+from yafs.placement import Placement
+from yafs.population import Population
+from yafs.selection import First_ShortestPath
+from yafs.topology import Topology
+
+
+class ListPlacement(Placement):
+    """
+    It deploys each module in a list of nodes
+    """
+
+    def __init__(self, allocation, **kwargs):
+        super(ListPlacement, self).__init__(**kwargs)
+        self.allocation = allocation
+
+    def initial_allocation(self, sim, app_name):
+        for module, nodes in self.allocation.items():
+            sim.deploy_module(app_name, module, sim.apps[app_name].services[module], nodes)
+
+
+class ListPopulation(Population):
+    """
+    It deploys the sources, with a deterministic period, and the sinks in a list of nodes
+    """
+
+    def __init__(self, sources, sinks=(), **kwargs):
+        super(ListPopulation, self).__init__(**kwargs)
+        self.sources = sources
+        self.sinks = sinks
+
+    def initial_allocation(self, sim, app_name):
+        for node, message, period in self.sources:
+            msg = sim.apps[app_name].get_message(message)
+            sim.deploy_source(app_name, id_node=node, msg=msg,
+                              distribution=deterministic_distribution(name="Deterministic", time=period))
+        for node, module in self.sinks:
+            sim.deploy_sink(app_name, node=node, module=module)
+
+
+def make_topology(links, bw=1, pr=1):
+    """
+    Args:
+        links (list): the edges (a, b) of the topology
+    """
+    nodes = sorted(set(n for link in links for n in link))
+    t = Topology()
+    t.load({"entity": [{"id": n, "RAM": 10, "IPT": 100, "type": "NODE"} for n in nodes],
+            "link": [{"s": a, "d": b, "BW": bw, "PR": pr} for a, b in links]})
+    return t
+
+
+def make_app(name="app", sink=False):
+    """
+    A chain: user -(M.U)-> A -(M.A)-> B [-(M.B)-> S if sink]
+    """
+    a = Application(name=name)
+    modules = [{"None": {"Type": Application.TYPE_SOURCE}}, {"A": {"RAM": 1, "Type": Application.TYPE_MODULE}},
+               {"B": {"RAM": 1, "Type": Application.TYPE_MODULE}}]
+    if sink:
+        modules.append({"S": {"Type": Application.TYPE_SINK}})
+    a.set_modules(modules)
+    m_u = Message("M.U", "None", "A", instructions=100, bytes=100)
+    m_a = Message("M.A", "A", "B", instructions=100, bytes=100)
+    a.add_source_messages(m_u)
+    a.add_service_module("A", m_u, m_a, lambda: True)
+    if sink:
+        m_b = Message("M.B", "B", "S", instructions=0, bytes=100)
+        a.add_service_module("B", m_a, m_b, lambda: True)
+    else:
+        a.add_service_module("B", m_a)
+    return a
+
+
+@pytest.fixture
+def make_sim(tmp_path):
+    """
+    A factory of simulations of :func:`make_app` in a :func:`make_topology`
+    """
+
+    def factory(links, allocation, sources, sinks=(), selector=None, sink=False, **kwargs):
+        random.seed(1)
+        np.random.seed(1)
+        t = make_topology(links)
+        s = Sim(t, default_results_path=str(tmp_path / "result"), **kwargs)
+        app = make_app(sink=sink)
+        s.deploy_app2(app, ListPlacement(name="Placement", allocation=allocation),
+                      ListPopulation(name="Population", sources=sources, sinks=sinks),
+                      selector if selector is not None else First_ShortestPath())
+        return s
+
+    return factory
+
+
+@pytest.fixture
+def run_sim():
+    def run(s, until):
+        with contextlib.redirect_stdout(io.StringIO()):
+            s.run(until)
+        return s
+
+    return run
@@ -0,0 +1,53 @@
+import copy
+
+import pytest
+
+from yafs.application import Message
+
+
+def _message():
+    msg = Message("M.A", "A", "B", instructions=100, bytes=20, broadcasting=True)
+    msg.timestamp = 3.5
+    msg.path = [0, 1, 2]
+    msg.dst_int = 1
+    msg.hop = 1
+    msg.app_name = "app"
+    msg.timestamp_rec = 4.0
+    msg.idDES = 7
+    msg.last_idDes = [2, 5]
+    msg.id = 11
+    msg.original_DES_src = 2
+    msg.multicast = (1, [[0, 1, 2]], [7])
+    return msg
+
+
+def test_message_attributes_are_slotted():
+    msg = Message("M.A", "A", "B")
+    assert not hasattr(msg, "__dict__")
+    with pytest.raises(AttributeError):
+        msg.other = 1
+    assert msg.hop == 0 and msg.multicast is None and msg.path == []
+
+
+def test_copy_keeps_every_attribute():
+    msg = _message()
+    other = copy.copy(msg)
+    assert other is not msg
+    assert type(other) is Message
+    for name in Message.__slots__:
+        assert getattr(other, name) == getattr(msg, name), name
+
+
+def test_copy_is_shallow_and_independent():
+    msg = _message()
+    other = copy.copy(msg)
+    # The lists are shared, they are replaced instead of modified by Sim
+    assert other.path is msg.path
+    assert other.last_idDes is msg.last_idDes
+    assert other.multicast is msg.multicast
+
+    other.hop = 2
+    other.idDES = 8
+    other.last_idDes = other.last_idDes + [7]
+    assert msg.hop == 1 and msg.idDES == 7 and msg.last_idDes == [2, 5]
+
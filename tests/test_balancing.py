@@ -0,0 +1,106 @@
+import random
+from collections import Counter
+
+import pandas as pd
+import pytest
+
+from yafs.balancing import Balancer, LeastOutstandingBalancer, PowerOfTwoBalancer, RoundRobinBalancer
+from yafs.path_routing import DeviceSpeedAwareRouting
+
+
+class FakeSim(object):
+    def __init__(self):
+        self.consumer_listeners = []
+
+    def take(self, idDES):
+        for listener in self.consumer_listeners:
+            listener("app", "A", idDES)
+
+
+def test_round_robin_takes_turns_by_group():
+    balancer = RoundRobinBalancer()
+    assert [balancer.choose(None, "app", "A", [1, 2, 3]) for i in range(6)] == [1, 2, 3, 1, 2, 3]
+    assert [balancer.choose(None, "app", "A", [4, 5]) for i in range(3)] == [4, 5, 4]
+    balancer.clear()
+    assert balancer.choose(None, "app", "A", [1, 2, 3]) == 1
+
+
+def test_least_outstanding_counts_the_messages_until_they_are_taken():
+    sim = FakeSim()
+    balancer = LeastOutstandingBalancer()
+    # Nothing has arrived yet: the burst is spread among the candidates
+    assert [balancer.choose(sim, "app", "A", [1, 2, 3]) for i in range(5)] == [1, 2, 3, 1, 2]
+    assert sim.consumer_listeners == [balancer.taken]
+    sim.take(3)
+    assert balancer.choose(sim, "app", "A", [1, 2, 3]) == 3
+    sim.take(1)
+    sim.take(1)
+    sim.take(1)
+    assert balancer.outstanding == {1: 0, 2: 2, 3: 1}
+    assert balancer.choose(sim, "app", "A", [1, 2, 3]) == 1
+    assert Balancer().choose(sim, "app", "A", [1, 2, 3]) == 1
+
+
+def test_power_of_two_never_chooses_the_most_outstanding_of_two():
+    random.seed(1)
+    sim = FakeSim()
+    balancer = PowerOfTwoBalancer()
+    chosen = Counter(balancer.choose(sim, "app", "A", [1, 2, 3]) for i in range(300))
+    # The counts never differ in more than one message
+    assert max(chosen.values()) - min(chosen.values()) <= 1
+    for i in range(chosen[2]):
+        sim.take(2)
+    assert all(balancer.choose(sim, "app", "A", [2, 3]) == 2 for i in range(50))
+    assert balancer.choose(sim, "app", "A", [3]) == 3
+
+
+def test_device_speed_aware_routing_balances_the_replicas_at_the_same_distance(make_sim, run_sim):
+    # A in 1 and 3 are at the same distance of 0 and 2
+    selector = DeviceSpeedAwareRouting()
+    s = make_sim([(0, 1), (1, 2), (2, 3), (3, 0)], {"A": [1, 3], "B": [2]}, [(0, "M.U", 10)], selector=selector)
+    run_sim(s, 50)
+    message = s.apps["app"].get_message("M.U")
+    chosen = Counter()
+    for i in range(10):
+        paths, DES = selector.get_path(s, "app", message, 0, s.alloc_DES, s.alloc_module, s.last_busy_time, None)
+        assert paths[0][-1] == s.alloc_DES[DES[0]]
+        chosen[DES[0]] += 1
+    assert sorted(chosen.values()) == [5, 5]
+    assert not hasattr(selector, "counter")
+
+
+def test_device_speed_aware_routing_passes_the_app_to_the_balancer(make_sim, run_sim):
+    calls = []
+
+    class Recorder(Balancer):
+        def choose(self, sim, app_name, service, candidates):
+            calls.append((app_name, service, tuple(candidates)))
+            return candidates[-1]
+
+    selector = DeviceSpeedAwareRouting(balancer=Recorder())
+    s = make_sim([(0, 1), (1, 2), (2, 3), (3, 0)], {"A": [1, 3], "B": [2]}, [(0, "M.U", 10)], selector=selector)
+    run_sim(s, 50)
+    assert calls
+    assert set(calls) == {("app", "A", tuple(s.alloc_module["app"]["A"]))}
+
+
+@pytest.mark.parametrize("balancer", [LeastOutstandingBalancer, PowerOfTwoBalancer])
+def test_outstanding_balancers_spread_a_burst(make_sim, run_sim, tmp_path, balancer):
+    # The source emits faster than a message reaches a replica
+    balancer = balancer()
+    s = make_sim([(0, 1), (1, 2), (2, 3), (3, 0)], {"A": [1, 3], "B": [2]}, [(0, "M.U", 10)],
+                 selector=DeviceSpeedAwareRouting(balancer=balancer))
+    taken = Counter()
+    s.consumer_listeners.append(lambda app_name, module, idDES: taken.update([module]))
+    run_sim(s, 1000)
+    df = pd.read_csv(str(tmp_path / "result.csv"))
+    links = pd.read_csv(str(tmp_path / "result_link.csv"))
+
+    received = df[df.module == "A"].groupby("DES.dst").size()
+    assert len(received) == 2
+    assert abs(received.iloc[0] - received.iloc[1]) <= 1
+    outstanding = sorted(balancer.outstanding.values())
+    assert len(outstanding) == 2 and outstanding[1] - outstanding[0] <= 1
+    # The outstanding messages are the chosen ones that have not been taken
+    chosen = links[links.message == "M.U"].id.nunique()
+    assert sum(outstanding) == chosen - taken["A"]
@@ -0,0 +1,131 @@
+import copy
+import os
+import sys
+
+import networkx as nx
+import pytest
+
+from yafs.path_routing import DeviceSpeedAwareRouting as PathDeviceSpeedAwareRouting
+from yafs.selection import First_ShortestPath, LoadAwareRouting
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "experiments", "rev"))
+from selection_multipleDeploys import DeviceSpeedAwareRouting  # noqa: E402
+
+RING = [(0, 1), (1, 2), (2, 3), (3, 4), (4, 0), (2, 5), (5, 6)]
+
+
+def test_changes_are_logged_with_the_version(make_sim, run_sim):
+    s = make_sim(RING, {"A": [2], "B": [3]}, [(0, "M.U", 10)])
+    run_sim(s, 50)
+    version = s.version
+    assert version > 0
+    s.remove_link(5, 6)
+    s.add_link(5, 6, 1, 1)
+    assert s.version == version + 2
+    assert s.get_changes(version) == [(s.CHANGE_REMOVE_LINK, (5, 6)), (s.CHANGE_ADD_LINK, (5, 6))]
+
+    s.remove_node(3)
+    changes = s.get_changes(version + 2)
+    assert changes[-1] == (s.CHANGE_REMOVE_NODE, 3)
+    assert [kind for kind, value in changes[:-1]] == [s.CHANGE_UNDEPLOY]
+
+
+def test_routing_table_follows_remove_link_and_remove_node(make_sim, run_sim):
+    s = make_sim(RING, {"A": [2], "B": [3]}, [(0, "M.U", 10)])
+    run_sim(s, 50)
+    routing = s.topology.get_routing_table()
+    assert routing.get_path(0, 2) == [0, 1, 2]
+
+    s.remove_link(1, 2)
+    assert routing.get_path(0, 2) == [0, 4, 3, 2]
+    s.remove_node(3)
+    with pytest.raises(Exception):
+        routing.get_path(0, 2)
+    assert routing.get_path(0, 1) == [0, 1]
+
+
+def test_dsar_cache_ignores_a_link_that_no_route_uses(make_sim, run_sim):
+    selector = DeviceSpeedAwareRouting()
+    s = make_sim(RING, {"A": [2], "B": [3]}, [(0, "M.U", 10)], selector=selector)
+    run_sim(s, 50)
+    cached = dict(selector.cache)
+    assert cached
+    assert 6 not in selector.cache_by_node
+
+    s.remove_link(5, 6)
+    selector.update_cache(s)
+    assert selector.cache == cached
+    assert selector.version == s.version
+
+
+def test_dsar_cache_evicts_the_routes_through_a_removed_link(make_sim, run_sim):
+    selector = DeviceSpeedAwareRouting()
+    s = make_sim(RING, {"A": [2], "B": [3]}, [(0, "M.U", 10)], selector=selector)
+    run_sim(s, 50)
+    through = [key for key, (path, des) in selector.cache.items() if [0, 1] == path[:2]]
+    assert through
+
+    s.remove_link(0, 1)
+    selector.update_cache(s)
+    for key in through:
+        assert key not in selector.cache
+    for path, des in selector.cache.values():
+        assert all({a, b} != {0, 1} for a, b in zip(path, path[1:]))
+
+
+def test_first_shortest_path_follows_remove_link(make_sim, run_sim):
+    selector = First_ShortestPath()
+    s = make_sim(RING, {"A": [2], "B": [3]}, [(0, "M.U", 10)], selector=selector)
+    run_sim(s, 50)
+    message = s.apps["app"].get_message("M.U")
+    paths, des = selector.get_path(s, "app", message, 0, s.alloc_DES, s.alloc_module, None, None)
+    assert paths == [[0, 1, 2]]
+
+    s.remove_link(1, 2)
+    paths, des = selector.get_path(s, "app", message, 0, s.alloc_DES, s.alloc_module, None, None)
+    assert paths == [[0, 4, 3, 2]]
+
+
+def test_dsar_chooses_the_fastest_replica(make_sim, run_sim):
+    selector = DeviceSpeedAwareRouting()
+    s = make_sim(RING, {"A": [2, 3, 6], "B": [4]}, [(0, "M.U", 10)], selector=selector)
+    s.topology.get_nodes_att()[3]["IPT"] = 1000
+    run_sim(s, 50)
+    message = s.apps["app"].get_message("M.U")
+    DES = s.alloc_module["app"]["A"]
+    weight = selector.link_weight(message.bytes)
+
+    for node_src in s.topology.G:
+        expected = min(DES, key=lambda des: nx.dijkstra_path_length(s.topology.G, node_src, s.alloc_DES[des], weight)
+                       + message.inst / float(s.topology.get_nodes_att()[s.alloc_DES[des]]["IPT"]))
+        path, des = selector.compute_DSAR(node_src, s.alloc_DES, s, DES, message)
+        assert des == expected
+        assert path == nx.dijkstra_path(s.topology.G, node_src, s.alloc_DES[des], weight)
+
+
+@pytest.mark.parametrize("selector", [DeviceSpeedAwareRouting, PathDeviceSpeedAwareRouting, LoadAwareRouting])
+def test_get_path_from_failure_keeps_the_destination(make_sim, run_sim, selector):
+    selector = selector()
+    s = make_sim(RING, {"A": [2], "B": [3]}, [(0, "M.U", 10)], selector=selector)
+    run_sim(s, 50)
+    message = copy.copy(s.apps["app"].get_message("M.U"))
+    message.app_name = "app"
+    message.path = [0, 1, 2]
+    message.hop = 2
+    message.idDES = s.alloc_module["app"]["A"][0]
+
+    s.remove_link(1, 2)
+    paths, DES = selector.get_path_from_failure(s, message, (1, 2), s.alloc_DES, s.alloc_module, s.last_busy_time,
+                                                s.env.now, message.idDES)
+    assert paths == [[0, 1, 0, 4, 3, 2]]
+    assert DES == [message.idDES]
+    assert message.hop == 1
+    assert message.dst_int == 1
+
+    # Without any reachable replica, the message is lost
+    message.path = [0, 1, 0, 4, 3, 2]
+    message.hop = 5
+    s.remove_link(3, 2)
+    paths, DES = selector.get_path_from_failure(s, message, (3, 2), s.alloc_DES, s.alloc_module, s.last_busy_time,
+                                                s.env.now, message.idDES)
+    assert paths == []
@@ -0,0 +1,137 @@
+import pandas as pd
+
+from conftest import ListPlacement, ListPopulation, make_app, make_topology
+from yafs.application import Application, Message
+from yafs.core import Sim
+from yafs.distribution import deterministic_distribution
+from yafs.selection import First_ShortestPath
+
+
+def test_consumer_dispatches_each_message_to_its_services(tmp_path, run_sim):
+    a = Application(name="app")
+    a.set_modules([{"None": {"Type": Application.TYPE_SOURCE}}, {"A": {"RAM": 1, "Type": Application.TYPE_MODULE}},
+                   {"B": {"RAM": 1, "Type": Application.TYPE_MODULE}}])
+    m_u = Message("M.U", "None", "A", instructions=100, bytes=100)
+    m_v = Message("M.V", "None", "A", instructions=200, bytes=100)
+    m_a = Message("M.A", "A", "B", instructions=100, bytes=100)
+    m_b = Message("M.B", "A", "B", instructions=100, bytes=100)
+    a.add_source_messages(m_u)
+    a.add_source_messages(m_v)
+    # M.U produces two messages, M.V none
+    a.add_service_module("A", m_u, m_a, lambda: True)
+    a.add_service_module("A", m_u, m_b, lambda: True)
+    a.add_service_module("A", m_v)
+    a.add_service_module("B", m_a)
+    a.add_service_module("B", m_b)
+
+    s = Sim(make_topology([(0, 1), (1, 2)]), default_results_path=str(tmp_path / "result"))
+    s.deploy_app2(a, ListPlacement(name="Placement", allocation={"A": [1], "B": [2]}),
+                  ListPopulation(name="Population", sources=[(0, "M.U", 10), (0, "M.V", 25)]), First_ShortestPath())
+    run_sim(s, 1000)
+
+    df = pd.read_csv(str(tmp_path / "result.csv"))
+    count = df.groupby(["module", "message"]).size()
+    assert count[("A", "M.U")] > 0 and count[("A", "M.V")] > 0
+    assert count[("B", "M.A")] == count[("B", "M.B")]
+    assert count[("B", "M.A")] <= count[("A", "M.U")]
+    assert set(df[df.module == "B"].message) == {"M.A", "M.B"}
+    # The service time of each message is its own one
+    A = df[df.module == "A"]
+    assert (A[A.message == "M.V"].service == 2).all()
+    assert (A[A.message == "M.U"].service == 1).all()
+
+
+def test_sink_modules_are_recorded_as_sinks(make_sim, run_sim, tmp_path):
+    s = make_sim([(0, 1), (1, 2), (2, 3)], {"A": [1], "B": [2]}, [(0, "M.U", 10)], sinks=[(3, "S")], sink=True)
+    run_sim(s, 1000)
+    df = pd.read_csv(str(tmp_path / "result.csv"))
+    sinks = df[df.module == "S"]
+    assert len(sinks) > 0
+    assert (sinks.type == "SINK_M").all()
+    assert (sinks.service == 0).all()
+    assert (df[df.module != "S"].type == "COMP_M").all()
+
+
+def _check_indexes(s):
+    nodes = {}
+    for des, node in s.alloc_DES.items():
+        nodes.setdefault(node, set()).add(des)
+    assert s.node_DES == nodes
+    for (app_name, module, node), DES in s.module_DES.items():
+        assert DES
+        for des in DES:
+            assert s.alloc_DES[des] == node
+            assert des in s.alloc_module[app_name][module]
+
+
+def test_DES_indexes_follow_the_deployments(make_sim, run_sim):
+    s = make_sim([(0, 1), (1, 2), (2, 3)], {"A": [1, 1, 2], "B": [2]}, [(0, "M.U", 10), (3, "M.U", 10)],
+                 sinks=[(3, "S")], sink=True)
+    run_sim(s, 100)
+    _check_indexes(s)
+    A = list(s.alloc_module["app"]["A"])
+    assert s.module_DES[("app", "A", 1)] == A[:2]
+    assert s.get_DES_from_Service_In_Node(1, "app", "A") == A[0]
+    assert s.get_DES_from_Service_In_Node(3, "app", "A") == []
+
+    s.undeploy_module("app", "A", A[0])
+    _check_indexes(s)
+    assert s.get_DES_from_Service_In_Node(1, "app", "A") == A[1]
+
+    s.undeploy_all_modules("app", "A", 1)
+    _check_indexes(s)
+    assert ("app", "A", 1) not in s.module_DES
+
+    source = next(des for des in s.alloc_source if s.alloc_source[des]["id"] == 3)
+    s.undeploy_source(source)
+    _check_indexes(s)
+    assert source not in s.node_DES[3]
+
+
+def test_results_record_the_DES_that_sent_each_message(make_sim, run_sim, tmp_path):
+    s = make_sim([(0, 1), (1, 2)], {"A": [1], "B": [2]}, [(0, "M.U", 10)])
+    run_sim(s, 1000)
+    df = pd.read_csv(str(tmp_path / "result.csv"))
+    source = next(iter(s.alloc_source))
+    A, = s.alloc_module["app"]["A"]
+    # The messages of the users come from the source DES, the others from the DES of their module
+    assert (df[df.module == "A"]["DES.src"] == source).all()
+    assert (df[df.module == "B"]["DES.src"] == A).all()
+
+
+def test_remove_node_removes_every_DES_of_the_node(tmp_path, run_sim):
+    a = make_app(sink=True)
+    # A also generates messages by itself
+    a.add_service_source("A", deterministic_distribution(name="Deterministic", time=20), a.services["A"][0]["message_out"])
+
+    s = Sim(make_topology([(0, 1), (1, 2), (2, 3)]), default_results_path=str(tmp_path / "result"))
+    s.deploy_app2(a, ListPlacement(name="Placement", allocation={"A": [2], "B": [3]}),
+                  ListPopulation(name="Population", sources=[(0, "M.U", 10), (2, "M.U", 10)], sinks=[(2, "S")]),
+                  First_ShortestPath())
+    run_sim(s, 100)
+
+    deployed = set(s.node_DES[2])
+    module = list(s.module_DES[("app", "A", 2)])
+    sink = list(s.module_DES[("app", "S", 2)])
+    source = [des for des in s.alloc_source if s.alloc_source[des]["id"] == 2]
+    generator = deployed - set(module) - set(sink) - set(source)
+    assert len(module) == len(sink) == len(source) == len(generator) == 1
+    version = s.version
+
+    summary = s.remove_node(2)
+    assert summary["node"] == 2
+    assert summary["modules"] == sorted([("app", "A", module[0]), ("app", "S", sink[0])], key=lambda item: item[2])
+    assert sorted(summary["sources"]) == sorted(source + list(generator))
+    assert summary["links"] == 2
+    assert summary["messages"] >= 0
+
+    assert 2 not in s.node_DES
+    assert all(des not in s.alloc_DES for des in deployed)
+    assert all(not s.des_process_running[des] for des in deployed)
+    assert all(des not in s.consumer_pipes for des in deployed)
+    assert source[0] not in s.alloc_source
+    assert s.alloc_module["app"]["A"] == [] and s.alloc_module["app"]["S"] == []
+    assert not [key for key in s.module_DES if key[2] == 2]
+    assert s.get_changes(version) == [(s.CHANGE_UNDEPLOY, item) for item in summary["modules"]] + \
+        [(s.CHANGE_REMOVE_NODE, 2)]
+    _check_indexes(s)
@@ -0,0 +1,114 @@
+import random
+
+import pandas as pd
+import pytest
+
+from yafs.link_buffer import LinkBuffer, REDBuffer, TailDropBuffer
+
+PERIOD = 10
+UNTIL = 2005
+
+
+def _expected_drops(latency, capacity):
+    """
+    A D/D/1/capacity queue: one arrival each PERIOD, one transfer each latency
+    """
+    busy = 0.0
+    ends = []
+    sent = drops = 0
+    for t in range(PERIOD, UNTIL, PERIOD):
+        ends = [end for end in ends if end > t]
+        if len(ends) >= capacity:
+            drops += 1
+        else:
+            busy = max(busy, t) + latency
+            ends.append(busy)
+            sent += 1
+    return sent, drops
+
+
+def _run(make_sim, run_sim, tmp_path, buffer):
+    # A and B are in the same node: the messages only cross the link (0, 1)
+    s = make_sim([(0, 1)], {"A": [1], "B": [1]}, [(0, "M.U", PERIOD)], link_buffer=buffer)
+    run_sim(s, UNTIL)
+    links = pd.read_csv(str(tmp_path / "result_link.csv"))
+    return s, links[(links.src == 0) & (links.dst == 1)]
+
+
+@pytest.mark.parametrize("capacity", [1, 3, 8])
+def test_tail_drop_losses(make_sim, run_sim, tmp_path, capacity):
+    buffer = TailDropBuffer(capacity)
+    s, links = _run(make_sim, run_sim, tmp_path, buffer)
+    sent, drops = _expected_drops(s.topology.get_link_latency((0, 1), 100), capacity)
+    assert drops > 0
+    assert buffer.drops == {(0, 1): drops}
+    assert buffer.dropped == drops
+    assert len(links) == sent
+
+
+def test_tail_drop_in_bytes(make_sim, run_sim, tmp_path):
+    buffer = TailDropBuffer(250, unit=LinkBuffer.UNIT_BYTES)
+    s, links = _run(make_sim, run_sim, tmp_path, buffer)
+    # two messages of 100 bytes fit in the buffer
+    sent, drops = _expected_drops(s.topology.get_link_latency((0, 1), 100), 2)
+    assert buffer.dropped == drops
+    assert len(links) == sent
+
+
+def test_red_without_averaging_drops_above_the_max_threshold(make_sim, run_sim, tmp_path):
+    # With weight 1, the average is the current queue: all the messages are dropped from 2 queued messages
+    buffer = REDBuffer(10, min_threshold=1, max_threshold=2, weight=1.0)
+    s, links = _run(make_sim, run_sim, tmp_path, buffer)
+    sent, drops = _expected_drops(s.topology.get_link_latency((0, 1), 100), 2)
+    assert buffer.dropped == drops
+    assert len(links) == sent
+
+
+def test_red_drop_probability():
+    random.seed(1)
+    buffer = REDBuffer(100, min_threshold=10, max_threshold=30, max_p=0.5, weight=1.0)
+    assert all(buffer.accept((0, 1), 5, 1) for i in range(100))
+    assert not any(buffer.accept((0, 1), 30, 1) for i in range(100))
+    # in the middle, the probability of dropping is max_p * 0.5
+    accepted = sum(buffer.accept((0, 1), 20, 1) for i in range(4000))
+    assert accepted / 4000.0 == pytest.approx(0.75, abs=0.03)
+
+
+def test_red_average_follows_the_queue():
+    buffer = REDBuffer(100, min_threshold=10, max_threshold=30, weight=0.5)
+    buffer.accept((0, 1), 8, 1)
+    buffer.accept((0, 1), 8, 1)
+    assert buffer.average[(0, 1)] == pytest.approx(6.0)
+    assert (1, 0) not in buffer.average
+
+
+def test_backpressure_delays_the_source_instead_of_dropping(make_sim, run_sim, tmp_path):
+    buffer = TailDropBuffer(3, backpressure=True)
+    s, links = _run(make_sim, run_sim, tmp_path, buffer)
+    latency = s.topology.get_link_latency((0, 1), 100)
+    assert buffer.dropped == 0
+    assert buffer.throttled > 0
+    # The link is always busy, and the source only emits when there is room in its queue
+    assert len(links) == pytest.approx(UNTIL / latency + 3, abs=1)
+    assert buffer.queued[(0, 1)] <= 3
+    # No emission is lost: the blocked message is sent later
+    ids = sorted(links.id)
+    assert ids == list(range(ids[0], ids[0] + len(ids)))
+
+    df = pd.read_csv(str(tmp_path / "result.csv"))
+    received = df[df.message == "M.U"]
+    # Each message is emitted when it is sent: its waiting time in the buffer is lower than the capacity of the link
+    assert (received.time_reception - received.time_emit).max() <= 3 * latency + 1e-9
+
+
+def test_link_buffer_queues_by_direction():
+    buffer = LinkBuffer(1)
+    assert buffer.enqueue((0, 1), 100)
+    assert buffer.enqueue((1, 0), 100)
+    assert buffer.is_full((0, 1), 100)
+    assert not buffer.enqueue((0, 1), 100)
+    assert buffer.drops == {(0, 1): 1}
+    buffer.dequeue((0, 1), 100)
+    assert not buffer.is_full((0, 1), 100)
+    assert not buffer.is_blocked((0, 1), 100)
+    assert not LinkBuffer(50, unit=LinkBuffer.UNIT_BYTES).is_blocked((0, 1), 100)
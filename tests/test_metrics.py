@@ -0,0 +1,203 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from yafs.metrics import AggregatePolicy, ColumnarWriter, Metrics, QuantileSketch, SamplingPolicy, TypeFilterPolicy
+from yafs.stats import iter_columnar, read_columnar, read_summary, Stats
+
+
+def test_columnar_types_are_fixed_by_the_schema(tmp_path):
+    path = str(tmp_path / "data.npy")
+    types = [ColumnarWriter.TYPE_INT, ColumnarWriter.TYPE_TEXT, ColumnarWriter.TYPE_FLOAT]
+    with open(path, "wb") as f:
+        w = ColumnarWriter(f, ["id", "name", "value"], types, chunk_size=2)
+        # the first block has no None, the second one only None, the last one both
+        for row in [(0, "a", 1), (1, "b", 2), (2, None, None), (3, None, None), (4, 5, 6)]:
+            w.writerow(row)
+        w.write_block()
+
+    blocks = list(iter_columnar(path))
+    assert len(blocks) == 3
+    for block in blocks:
+        assert block["id"].dtype == np.int64
+        assert block["value"].dtype == np.float64
+        assert not pd.api.types.is_numeric_dtype(block["name"])
+
+    df = read_columnar(path)
+    assert df["id"].tolist() == [0, 1, 2, 3, 4]
+    assert df["name"].tolist() == ["a", "b", "", "", "5"]
+    assert df["value"].dtype == np.float64
+    assert np.isnan(df["value"].values[2:4]).all()
+    assert df["value"].values[4] == 6
+
+
+def test_columnar_rejects_a_wrong_schema(tmp_path):
+    with open(str(tmp_path / "data.npy"), "wb") as f:
+        with pytest.raises(ValueError):
+            ColumnarWriter(f, ["id", "name"], [ColumnarWriter.TYPE_INT])
+        with pytest.raises(ValueError):
+            ColumnarWriter(f, ["id"], ["date"])
+
+
+def test_columnar_widens_the_values_that_do_not_fit_the_schema(tmp_path):
+    path = str(tmp_path / "data.npy")
+    types = [ColumnarWriter.TYPE_INT, ColumnarWriter.TYPE_INT, ColumnarWriter.TYPE_FLOAT]
+    with open(path, "wb") as f:
+        w = ColumnarWriter(f, ["src", "size", "node"], types, chunk_size=2)
+        for row in [(0, 10, 1), (1, 20, None), ("n0", 10.5, "n1"), (2, None, 3), (3, 30, 4)]:
+            w.writerow(row)
+        w.write_block()
+
+    blocks = list(iter_columnar(path))
+    assert blocks[0]["src"].dtype == np.int64
+    assert blocks[0]["size"].dtype == np.int64
+    assert blocks[0]["node"].dtype == np.float64
+    # Once a column is widened, the next blocks keep the wider type
+    for block in blocks[1:]:
+        assert not pd.api.types.is_numeric_dtype(block["src"])
+        assert block["size"].dtype == np.float64
+        assert not pd.api.types.is_numeric_dtype(block["node"])
+
+    df = read_columnar(path)
+    assert df["src"].tolist() == [0, 1, "n0", "2", "3"]
+    assert df["size"].tolist()[:3] == [10, 20, 10.5]
+    assert np.isnan(df["size"].values[3])
+    assert df["node"].tolist()[2:] == ["n1", "3", "4"]
+
+
+def test_npy_links_with_string_nodes_and_float_sizes(tmp_path):
+    records = [{"id": i, "type": "LINK", "src": "n%i" % i, "dst": "n%i" % (i + 1), "app": "app", "latency": 1.5,
+                "message": "M.A", "ctime": float(i), "size": 10.5 + i, "buffer": 0} for i in range(5)]
+    for format in [Metrics.FORMAT_CSV, Metrics.FORMAT_NPY]:
+        metrics = Metrics(default_results_path=str(tmp_path / format), format=format, chunk_size=2)
+        for record in records:
+            metrics.insert_link(record)
+        metrics.close()
+
+    csv = pd.read_csv(str(tmp_path / "csv_link.csv"))
+    npy = read_columnar(str(tmp_path / "npy_link.npy"))
+    assert npy["src"].tolist() == csv["src"].tolist() == ["n%i" % i for i in range(5)]
+    assert npy["dst"].tolist() == csv["dst"].tolist()
+    assert npy["size"].tolist() == csv["size"].tolist() == [10.5 + i for i in range(5)]
+
+@pytest.mark.parametrize("chunk_size", [7, 100000])
+def test_npy_and_csv_results_are_the_same(make_sim, run_sim, tmp_path, chunk_size):
+    csv_path = str(tmp_path / "csv")
+    npy_path = str(tmp_path / "npy")
+    run_sim(make_sim([(0, 1), (1, 2)], {"A": [1], "B": [2]}, [(0, "M.U", 10)],
+                     metrics=Metrics(default_results_path=csv_path)), 500)
+    run_sim(make_sim([(0, 1), (1, 2)], {"A": [1], "B": [2]}, [(0, "M.U", 10)],
+                     metrics=Metrics(default_results_path=npy_path, format=Metrics.FORMAT_NPY,
+                                     chunk_size=chunk_size)), 500)
+
+    for suffix in ["", "_link"]:
+        csv = pd.read_csv(csv_path + suffix + ".csv")
+        text = pd.read_csv(csv_path + suffix + ".csv", dtype=str, keep_default_na=False)
+        npy = read_columnar(npy_path + suffix + ".npy")
+        assert len(csv) > 0
+        assert list(csv.columns) == list(npy.columns)
+        for name in csv.columns:
+            if not pd.api.types.is_numeric_dtype(npy[name]):
+                assert npy[name].tolist() == text[name].tolist(), name
+            else:
+                np.testing.assert_allclose(npy[name].values.astype(float), csv[name].values.astype(float),
+                                           err_msg=name)
+
+    csv_stats = Stats(defaultPath=csv_path)
+    npy_stats = Stats(defaultPath=npy_path, format=Metrics.FORMAT_NPY)
+    pd.testing.assert_frame_equal(csv_stats.times("time_response"), npy_stats.times("time_response"),
+                                  check_dtype=False)
+
+
+def _event(i, type="COMP_M", response=1.0):
+    return {"id": i, "type": type, "app": "app", "module": "A", "message": "M.U", "DES.src": None, "DES.dst": 1,
+            "TOPO.src": 0, "TOPO.dst": 1, "module.src": "None", "service": 0.5, "time_in": i + 0.5,
+            "time_out": i + response, "time_emit": float(i), "time_reception": i + 0.25}
+
+
+def _link(i):
+    return {"id": i, "type": "LINK", "src": 0, "dst": 1, "app": "app", "latency": 2.0, "message": "M.U",
+            "ctime": float(i), "size": 100, "buffer": 0}
+
+
+def _write(path, n=250, **kwargs):
+    m = Metrics(default_results_path=path, **kwargs)
+    for i in range(n):
+        m.insert(_event(i))
+        m.insert_link(_link(i))
+    m.close()
+    return m
+
+
+@pytest.mark.parametrize("format", [Metrics.FORMAT_CSV, Metrics.FORMAT_NPY])
+def test_threaded_writer_writes_the_same_files(tmp_path, format):
+    plain = str(tmp_path / "plain")
+    threaded = str(tmp_path / "threaded")
+    _write(plain, format=format, chunk_size=16)
+    _write(threaded, format=format, chunk_size=16, threaded=True, max_pending_records=32)
+    for suffix in ["", "_link"]:
+        with open("%s%s.%s" % (plain, suffix, format), "rb") as a, open("%s%s.%s" % (threaded, suffix, format), "rb") as b:
+            assert a.read() == b.read()
+
+
+def test_threaded_writer_flush_writes_the_pending_batches(tmp_path):
+    path = str(tmp_path / "threaded")
+    m = Metrics(default_results_path=path, chunk_size=16, threaded=True)
+    for i in range(20):
+        m.insert(_event(i))
+    m.flush()
+    assert len(pd.read_csv(path + ".csv")) == 20
+    m.close()
+
+
+def test_threaded_writer_raises_the_errors_of_the_thread(tmp_path):
+    m = Metrics(default_results_path=str(tmp_path / "threaded"), format=Metrics.FORMAT_NPY, chunk_size=4,
+                threaded=True)
+    for i in range(8):
+        value = _event(i)
+        # ragged values can not be a column
+        value["time_in"] = [0] * i
+        m.insert(value)
+    with pytest.raises(ValueError):
+        m.close()
+
+
+def test_sampling_policy_keeps_one_of_each_n_records_by_type(tmp_path):
+    path = str(tmp_path / "sampled")
+    _write(path, n=100, policies=[SamplingPolicy(10)])
+    assert pd.read_csv(path + ".csv")["id"].tolist() == list(range(0, 100, 10))
+    assert pd.read_csv(path + "_link.csv")["id"].tolist() == list(range(0, 100, 10))
+
+
+def test_type_filter_policy(tmp_path):
+    path = str(tmp_path / "filtered")
+    _write(path, n=10, policies=[TypeFilterPolicy(["LINK"])])
+    assert len(pd.read_csv(path + ".csv")) == 0
+    assert len(pd.read_csv(path + "_link.csv")) == 10
+
+
+def test_quantile_sketch_relative_error():
+    sketch = QuantileSketch(alpha=0.01)
+    values = np.arange(1, 10001, dtype=float)
+    for v in values:
+        sketch.add(v)
+    for q in (0.5, 0.95, 0.99):
+        exact = np.quantile(values, q, method="lower")
+        assert abs(sketch.quantile(q) - exact) <= 0.01 * exact
+    assert np.isnan(QuantileSketch().quantile(0.5))
+
+
+@pytest.mark.parametrize("keep_records", [False, True])
+def test_aggregate_policy_summary(tmp_path, keep_records):
+    path = str(tmp_path / "aggregated")
+    _write(path, n=100, policies=[AggregatePolicy(keep_records=keep_records, quantiles=(0.5,))])
+    assert len(pd.read_csv(path + ".csv")) == (100 if keep_records else 0)
+
+    messages, links = read_summary(path)
+    assert messages["count"].tolist() == [100]
+    assert messages["time_total_response_mean"].iloc[0] == pytest.approx(1.0)
+    assert messages["time_latency_mean"].iloc[0] == pytest.approx(0.25)
+    assert messages["p50"].iloc[0] == pytest.approx(1.0, rel=0.01)
+    assert links["count"].tolist() == [100]
+    assert links["size"].tolist() == [100 * 100]
+    assert links["busy"].iloc[0] == pytest.approx(200.0)
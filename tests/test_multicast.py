@@ -0,0 +1,108 @@
+import logging
+from collections import Counter
+
+import pandas as pd
+
+from yafs.selection import Selection
+from yafs.trace import EventTrace
+
+TREE = [(0, 1), (1, 2), (1, 3), (3, 4), (3, 5)]
+
+
+class Broadcast(Selection):
+    """
+    It sends the message to all the replicas through the shortest paths
+    """
+
+    def get_path(self, sim, app_name, message, topology_src, alloc_DES, alloc_module, traffic, from_des):
+        routing = sim.topology.get_routing_table()
+        DES = alloc_module[app_name][message.dst]
+        return [routing.get_path(topology_src, alloc_DES[des]) for des in DES], list(DES)
+
+    def get_path_from_failure(self, sim, message, link, alloc_DES, alloc_module, traffic, ctime, from_des):
+        idx = message.hop - 1
+        node_src = message.path[idx]
+        if node_src not in sim.topology.G:
+            # The message was in a removed node
+            return [], [None]
+        path = sim.topology.get_routing_table().get_path_towards(node_src, alloc_DES[message.idDES])
+        message.hop = idx
+        message.dst_int = node_src
+        return [message.path[0:idx] + path], [message.idDES]
+
+
+def test_multicast_tree_delivers_to_every_replica(make_sim, run_sim, tmp_path):
+    s = make_sim(TREE, {"A": [1, 2, 4, 5, 0], "B": [0]}, [(0, "M.U", 1000)], selector=Broadcast())
+    run_sim(s, 5500)
+    df = pd.read_csv(str(tmp_path / "result.csv"))
+    links = pd.read_csv(str(tmp_path / "result_link.csv"))
+
+    received = df[df.message == "M.U"].groupby("DES.dst").size()
+    assert sorted(received.index) == sorted(s.alloc_module["app"]["A"])
+    emitted = received.iloc[0]
+    assert emitted > 0
+    assert (received == emitted).all()
+
+    # The message crosses each link of the tree once
+    crossed = links[links.message == "M.U"].groupby(["src", "dst"]).size()
+    assert sorted(crossed.index) == [(0, 1), (1, 2), (1, 3), (3, 4), (3, 5)]
+    assert (crossed == emitted).all()
+
+    # and each replica receives a message with its own path
+    for des, records in df[df.message == "M.U"].groupby("DES.dst"):
+        assert (records["TOPO.dst"] == s.alloc_DES[des]).all()
+
+
+def test_multicast_tree_is_rerouted_when_a_link_fails(make_sim, run_sim, tmp_path):
+    s = make_sim(TREE + [(2, 4)], {"A": [2, 4, 5], "B": [0]}, [(0, "M.U", 1000)], selector=Broadcast())
+
+    def failure():
+        # the first message is crossing the link (1, 2) of its route to 4
+        yield s.env.timeout(1150)
+        s.remove_link(2, 4)
+
+    s.env.process(failure())
+    run_sim(s, 5500)
+    df = pd.read_csv(str(tmp_path / "result.csv"))
+    received = df[df.message == "M.U"].groupby("DES.dst").size()
+    assert sorted(received.index) == sorted(s.alloc_module["app"]["A"])
+    assert received.nunique() == 1
+
+    links = pd.read_csv(str(tmp_path / "result_link.csv"))
+    first = links[(links.message == "M.U") & (links.ctime < 2000)]
+    assert list(zip(first.src, first.dst)).count((2, 1)) == 1
+    assert (3, 4) in list(zip(first.src, first.dst))
+
+
+def test_multicast_deliveries_are_traced(make_sim, run_sim):
+    trace = EventTrace()
+    s = make_sim(TREE, {"A": [1, 2, 4, 5, 0], "B": [0]}, [(0, "M.U", 1000)], selector=Broadcast(), trace=trace)
+    run_sim(s, 5500)
+    events = trace.get_events()
+    replicas = set(s.alloc_module["app"]["A"])
+    delivered = Counter(int(des) for des in events[events["kind"] == EventTrace.KIND_DELIVER]["DES"] if des in replicas)
+    assert set(delivered) == replicas
+    assert set(delivered.values()) == {5}
+
+
+def test_multicast_delivery_to_a_removed_module_is_lost(make_sim, run_sim, caplog):
+    logger = logging.getLogger("test_multicast")
+    logger.setLevel(logging.DEBUG)
+    trace = EventTrace()
+    # The replica in 1 is a delivery of the tree, on the way to 2
+    s = make_sim(TREE, {"A": [1, 2], "B": [0]}, [(0, "M.U", 1000)], selector=Broadcast(), trace=trace, logger=logger)
+    removed = []
+
+    def failure():
+        # the first message is crossing the link (0, 1)
+        yield s.env.timeout(1050)
+        removed.append(s.get_DES_from_Service_In_Node(1, "app", "A"))
+        s.remove_node(1)
+
+    s.env.process(failure())
+    with caplog.at_level(logging.DEBUG, logger="test_multicast"):
+        run_sim(s, 1500)
+    assert "The module of the message M.U has been removed. Message is lost" in caplog.text
+    events = trace.get_events()
+    assert [(e["kind"], e["DES"], e["a"]) for e in events[events["kind"] >= EventTrace.KIND_DELIVER]] == \
+        [(EventTrace.KIND_DELIVER, removed[0], 1), (EventTrace.KIND_LOST, s.alloc_module["app"]["A"][0], 1)]
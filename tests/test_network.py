@@ -0,0 +1,97 @@
+import pandas as pd
+import pytest
+
+from yafs.path_routing import DeviceSpeedAwareRouting
+from yafs.selection import Selection
+
+# With the topology of conftest, a message of 100 bytes crosses a link in 101 time units
+HOP = 101
+
+
+def test_idle_links_take_the_latency_of_each_hop(make_sim, run_sim, tmp_path):
+    s = make_sim([(0, 1), (1, 2)], {"A": [2], "B": [2]}, [(0, "M.U", 1000)])
+    run_sim(s, 5500)
+    df = pd.read_csv(str(tmp_path / "result.csv"))
+    links = pd.read_csv(str(tmp_path / "result_link.csv"))
+
+    A = df[df.module == "A"]
+    assert len(A) == 5
+    assert (A.time_reception - A.time_emit == 2 * HOP).all()
+    for id, hops in links.groupby("id"):
+        assert list(zip(hops.src, hops.dst)) == [(0, 1), (1, 2)]
+        assert list(hops.ctime) == [1000 * id, 1000 * id + HOP]
+        assert (hops.latency == HOP).all()
+
+
+def test_busy_links_queue_the_transfers(make_sim, run_sim, tmp_path):
+    # The source emits faster than the link (0, 1) transmits
+    s = make_sim([(0, 1), (1, 2)], {"A": [2], "B": [2]}, [(0, "M.U", 50)])
+    run_sim(s, 1000)
+    df = pd.read_csv(str(tmp_path / "result.csv"))
+    links = pd.read_csv(str(tmp_path / "result_link.csv"))
+
+    A = df[df.module == "A"].sort_values("id")
+    assert len(A) > 3
+    # Each message leaves the link (0, 1) when the previous one has been transmitted
+    assert list(A.time_reception) == [50 + HOP * (id + 1) for id in A.id]
+    second = links[links.src == 1].sort_values("ctime")
+    assert list(second.ctime) == [50 + HOP * id for id in second.id]
+
+
+@pytest.mark.parametrize("until, pending", [(1050, 1), (1150, 1), (1250, 0)])
+def test_network_pump_counts_the_transfers_in_progress(make_sim, run_sim, until, pending):
+    s = make_sim([(0, 1), (1, 2)], {"A": [2], "B": [2]}, [(0, "M.U", 1000)])
+    run_sim(s, until)
+    assert s.network_pump == pending
+
+
+class FixedPath(Selection):
+    """
+    It sends the messages towards the first replica through a given path
+    """
+
+    def __init__(self, path):
+        super(FixedPath, self).__init__()
+        self.path = path
+
+    def get_path(self, sim, app_name, message, topology_src, alloc_DES, alloc_module, traffic, from_des):
+        if message.dst != "A":
+            return [[topology_src]], [alloc_module[app_name][message.dst][0]]
+        return [self.path], [alloc_module[app_name][message.dst][0]]
+
+
+def test_hop_cursor_follows_paths_that_visit_a_node_twice(make_sim, run_sim, tmp_path):
+    path = [0, 1, 0, 1, 2]
+    s = make_sim([(0, 1), (1, 2)], {"A": [2], "B": [2]}, [(0, "M.U", 1000)], selector=FixedPath(path))
+    run_sim(s, 3500)
+    df = pd.read_csv(str(tmp_path / "result.csv"))
+    links = pd.read_csv(str(tmp_path / "result_link.csv"))
+
+    A = df[df.module == "A"]
+    assert len(A) == 3
+    assert (A.time_reception - A.time_emit == 4 * HOP).all()
+    for id, hops in links.groupby("id"):
+        assert list(zip(hops.src, hops.dst)) == list(zip(path, path[1:]))
+        assert list(hops.ctime) == [1000 * id + HOP * i for i in range(4)]
+
+
+def test_hop_cursor_restarts_after_a_failure(make_sim, run_sim, tmp_path):
+    # The link (1, 2) fails while the first message is crossing (0, 1)
+    s = make_sim([(0, 1), (1, 2), (0, 3), (3, 2)], {"A": [2], "B": [2]}, [(0, "M.U", 1000)],
+                 selector=DeviceSpeedAwareRouting())
+
+    def failure():
+        yield s.env.timeout(1050)
+        s.topology.remove_edge(1, 2)
+
+    s.env.process(failure())
+    run_sim(s, 1500)
+    links = pd.read_csv(str(tmp_path / "result_link.csv"))
+    df = pd.read_csv(str(tmp_path / "result.csv"))
+    # The message goes back from 1 towards the other route
+    hops = links[links.id == 1]
+    assert list(zip(hops.src, hops.dst)) == [(0, 1), (1, 0), (0, 3), (3, 2)]
+    A = df[df.module == "A"]
+    # The path keeps its prefix: the emitter is still the source node
+    assert list(A["TOPO.src"]) == [0]
+    assert list(A.time_reception - A.time_emit) == [4 * HOP]
@@ -0,0 +1,128 @@
+import random
+
+import networkx as nx
+import pytest
+
+from yafs.routing_table import RoutingTable
+from yafs.topology import Topology
+
+
+def _graph(seed=3, n=30):
+    G = nx.connected_watts_strogatz_graph(n, 4, 0.3, seed=seed)
+    rnd = random.Random(seed)
+    for src, dst in G.edges:
+        G[src][dst]["PR"] = rnd.randint(1, 10)
+        G[src][dst]["BW"] = rnd.randint(1, 10)
+    return G
+
+
+def _weight_function(weight):
+    if weight is None:
+        return lambda src, dst, att: 1
+    if callable(weight):
+        return weight
+    return lambda src, dst, att: att[weight]
+
+
+def _check(table, G, weight):
+    """
+    Compares the paths of the table with the distances of networkx
+    """
+    w = _weight_function(weight)
+    for source in G:
+        expected = nx.single_source_dijkstra_path_length(G, source, weight=w)
+        assert table.get_distances(source, weight) == pytest.approx(expected)
+        for target in G:
+            path = table.get_path(source, target, weight)
+            assert path[0] == source and path[-1] == target
+            assert sum(w(u, v, G[u][v]) for u, v in zip(path, path[1:])) == pytest.approx(expected[target])
+            assert table.get_path_towards(target, source, weight) == path[::-1]
+
+
+@pytest.mark.parametrize("weight", [None, "PR", lambda src, dst, att: att["PR"] + att["BW"]])
+def test_paths_are_shortest(weight):
+    G = _graph()
+    table = RoutingTable(G)
+    _check(table, G, weight)
+
+
+def test_unreachable_and_unknown_nodes():
+    G = nx.Graph([(0, 1), (2, 3)])
+    table = RoutingTable(G)
+    with pytest.raises(nx.NetworkXNoPath):
+        table.get_path(0, 3)
+    with pytest.raises(nx.NetworkXNoPath):
+        table.get_distance(0, 3)
+    with pytest.raises(nx.NetworkXNoPath):
+        table.get_path_towards(0, 3)
+    with pytest.raises(nx.NodeNotFound):
+        table.get_path(9, 0)
+
+
+@pytest.mark.parametrize("weight", [None, "PR"])
+def test_remove_edge_only_discards_the_trees_that_use_it(weight):
+    G = _graph()
+    table = RoutingTable(G)
+    _check(table, G, weight)
+    trees = dict(table.trees)
+
+    src, dst = next((u, v) for u, v in G.edges if G.degree(u) > 2 and G.degree(v) > 2)
+    G.remove_edge(src, dst)
+    table.remove_edge(src, dst)
+    for (source, w), tree in trees.items():
+        parent = tree[1]
+        uses_link = parent.get(dst) == src or parent.get(src) == dst
+        assert ((source, w) in table.trees) != uses_link
+    _check(table, G, weight)
+
+
+@pytest.mark.parametrize("weight", [None, "PR"])
+def test_remove_node_updates_the_trees(weight):
+    G = _graph()
+    table = RoutingTable(G)
+    _check(table, G, weight)
+    leafs = [n for n in G if all(n not in tree[2] for tree in table.trees.values())]
+
+    for node in leafs[:1] + [max(G, key=G.degree)]:
+        G.remove_node(node)
+        table.remove_node(node)
+        assert all(node not in tree[0] for tree in table.trees.values())
+        _check(table, G, weight)
+
+
+@pytest.mark.parametrize("weight", [None, "PR"])
+def test_add_edge_and_node_update_the_trees(weight):
+    G = _graph()
+    table = RoutingTable(G)
+    _check(table, G, weight)
+
+    G.add_edge(0, 15, PR=1, BW=1)
+    table.add_edge(0, 15)
+    _check(table, G, weight)
+
+    G.add_edge(100, 3, PR=1, BW=1)
+    G.add_edge(100, 20, PR=50, BW=1)
+    table.add_node(100)
+    _check(table, G, weight)
+
+
+def test_topology_updates_its_routing_table():
+    t = Topology()
+    t.create_topology_from_graph(_graph())
+    table = t.get_routing_table()
+    assert t.get_routing_table() is table
+    path = table.get_path(0, 15)
+
+    t.remove_edge(path[0], path[1])
+    assert table.get_path(0, 15)[:2] != path[:2]
+    _check(table, t.G, None)
+
+    t.remove_node(path[1])
+    assert path[1] not in table.get_path(0, 15)
+    _check(table, t.G, None)
+
+    t.add_edge(0, 15, 1, 1)
+    assert table.get_path(0, 15) == [0, 15]
+
+    t.create_topology_from_graph(_graph(seed=4))
+    assert t.get_routing_table() is not table
@@ -0,0 +1,168 @@
+import logging
+
+import networkx as nx
+import pandas as pd
+import pytest
+
+from yafs.selection import CachedSelection, First_ShortestPath, LoadAwareRouting, OneRandomPath
+from yafs.topology import Topology
+
+GRID = [(0, 1), (1, 2), (2, 3), (0, 4), (4, 5), (5, 3), (1, 5), (2, 6), (6, 7), (7, 3)]
+
+
+class CheckedLoadAwareRouting(LoadAwareRouting):
+    """
+    It compares each decision with the one of walking all the links of the path of each replica
+    """
+
+    def __init__(self):
+        super(CheckedLoadAwareRouting, self).__init__()
+        self.decisions = 0
+
+    def expected(self, sim, app_name, message, topology_src, alloc_DES, alloc_module, traffic):
+        now = sim.env.now
+        best = (float("inf"), None)
+        for des in alloc_module[app_name][message.dst]:
+            node_dst = alloc_DES[des]
+            weight = lambda src, dst, att: att[Topology.LINK_PR] + message.bytes / att[Topology.LINK_BW]
+            try:
+                path = sim.topology.get_routing_table().get_path(topology_src, node_dst, weight)
+            except (nx.NetworkXNoPath, nx.NodeNotFound):
+                continue
+            arrival = now
+            for link in zip(path, path[1:]):
+                arrival = max(arrival, traffic.get(link, 0.0)) + sim.topology.get_link_latency(link, message.bytes)
+            service = message.inst / float(sim.topology.get_nodes_att()[node_dst]["IPT"])
+            backlog = sim.get_consumer_backlog(app_name, message.dst, des)
+            completion = max(arrival, now + backlog * service) + service
+            best = min(best, (completion, des), key=lambda item: item[0])
+        return best[1]
+
+    def get_path(self, sim, app_name, message, topology_src, alloc_DES, alloc_module, traffic, from_des):
+        paths, DES = super(CheckedLoadAwareRouting, self).get_path(sim, app_name, message, topology_src, alloc_DES,
+                                                                   alloc_module, traffic, from_des)
+        assert DES == [self.expected(sim, app_name, message, topology_src, alloc_DES, alloc_module, traffic)]
+        self.decisions += 1
+        return paths, DES
+
+
+def test_load_aware_routing_keeps_the_decisions_of_walking_the_links(make_sim, run_sim):
+    selector = CheckedLoadAwareRouting()
+    s = make_sim(GRID, {"A": [3, 6, 5], "B": [7, 4]}, [(0, "M.U", 1), (2, "M.U", 2), (4, "M.U", 3)],
+                 selector=selector)
+    run_sim(s, 300)
+    assert selector.decisions > 100
+    assert s.link_listeners == [selector.update_link]
+
+
+def test_load_aware_routing_unreachable_replicas(make_sim, run_sim, caplog):
+    selector = LoadAwareRouting()
+    s = make_sim([(0, 1), (1, 2), (3, 4)], {"A": [4], "B": [3]}, [(0, "M.U", 10)], selector=selector)
+    with caplog.at_level(logging.WARNING):
+        run_sim(s, 50)
+    assert "Unreacheable DST" in caplog.text
+
+    message = s.apps["app"].get_message("M.U")
+    assert selector.get_path(s, "app", message, 0, s.alloc_DES, s.alloc_module, s.last_busy_time, None) == ([], [None])
+
+
+@pytest.mark.parametrize("selector", [First_ShortestPath, OneRandomPath, LoadAwareRouting])
+def test_selectors_reach_every_module(make_sim, run_sim, selector, tmp_path):
+    s = make_sim(GRID, {"A": [3], "B": [7]}, [(0, "M.U", 10), (4, "M.U", 10)], selector=selector())
+    run_sim(s, 3000)
+    df = pd.read_csv(str(tmp_path / "result.csv"))
+    assert set(df.module) == {"A", "B"}
+    links = pd.read_csv(str(tmp_path / "result_link.csv"))
+    assert all(s.topology.G.has_edge(src, dst) for src, dst in zip(links.src, links.dst))
+
+
+def test_one_random_path_returns_a_simple_path_to_each_replica(make_sim, run_sim):
+    selector = OneRandomPath(k=3)
+    s = make_sim(GRID, {"A": [3, 6], "B": [7]}, [(0, "M.U", 10)], selector=selector)
+    run_sim(s, 50)
+    message = s.apps["app"].get_message("M.U")
+    options = {des: list(nx.shortest_simple_paths(s.topology.G, 0, s.alloc_DES[des]))[:3]
+               for des in s.alloc_module["app"]["A"]}
+    for i in range(20):
+        paths, DES = selector.get_path(s, "app", message, 0, s.alloc_DES, s.alloc_module, s.last_busy_time, None)
+        assert DES == s.alloc_module["app"]["A"]
+        for path, des in zip(paths, DES):
+            assert path in options[des]
+
+    s.remove_link(0, 1)
+    paths, DES = selector.get_path(s, "app", message, 0, s.alloc_DES, s.alloc_module, s.last_busy_time, None)
+    assert all(path[:2] != [0, 1] for path in paths)
+
+
+def test_first_shortest_path_chooses_the_nearest_replica(make_sim, run_sim):
+    selector = First_ShortestPath()
+    s = make_sim(GRID, {"A": [3, 6], "B": [7]}, [(0, "M.U", 10)], selector=selector)
+    run_sim(s, 50)
+    message = s.apps["app"].get_message("M.U")
+    for node in s.topology.G:
+        paths, DES = selector.get_path(s, "app", message, node, s.alloc_DES, s.alloc_module, s.last_busy_time, None)
+        expected = min(nx.shortest_path_length(s.topology.G, node, s.alloc_DES[des]) for des in s.alloc_module["app"]["A"])
+        assert len(paths[0]) - 1 == expected
+        assert paths[0][-1] == s.alloc_DES[DES[0]]
+
+    assert selector.get_path(s, "app", message, 100, s.alloc_DES, s.alloc_module, s.last_busy_time, None) == ([], [None])
+
+
+@pytest.mark.parametrize("selector", [First_ShortestPath, OneRandomPath])
+def test_selectors_report_unreachable_replicas(make_sim, run_sim, selector, caplog):
+    selector = selector()
+    s = make_sim([(0, 1), (1, 2), (3, 4)], {"A": [4], "B": [3]}, [(0, "M.U", 10)], selector=selector)
+    with caplog.at_level(logging.WARNING):
+        run_sim(s, 50)
+    assert "Unreacheable DST" in caplog.text
+
+    message = s.apps["app"].get_message("M.U")
+    assert selector.get_path(s, "app", message, 0, s.alloc_DES, s.alloc_module, s.last_busy_time, None) == ([], [None])
+
+
+class CachedShortestPath(CachedSelection, First_ShortestPath):
+    pass
+
+
+def test_cached_selection_reuses_the_decisions_until_a_change(make_sim, run_sim):
+    selector = CachedShortestPath(cache_size=2)
+    s = make_sim(GRID, {"A": [3], "B": [7]}, [(0, "M.U", 10)], selector=selector)
+    run_sim(s, 50)
+    message = s.apps["app"].get_message("M.U")
+
+    def get_path(node):
+        return selector.get_path(s, "app", message, node, s.alloc_DES, s.alloc_module, s.last_busy_time, None)
+
+    selector.clear_decisions()
+    hits, misses = selector.hits, selector.misses
+    first = get_path(0)
+    assert get_path(0)[0] is first[0]
+    assert (selector.hits - hits, selector.misses - misses) == (1, 1)
+
+    # least recently used decisions are discarded beyond cache_size
+    get_path(1)
+    get_path(2)
+    assert list(selector.decisions) == [(1, "app", "A", 7), (2, "app", "A", 7)]
+
+    s.remove_link(0, 1)
+    get_path(2)
+    assert list(selector.decisions) == [(2, "app", "A", 7)]
+    assert get_path(0)[0][0][:2] != [0, 1]
+
+
+def test_cached_selection_groups_the_message_sizes():
+    selector = CachedShortestPath()
+    assert selector.size_class(100) == selector.size_class(127) != selector.size_class(128)
+    assert selector.cache_size == 10000
+
+
+def test_cached_selection_does_not_keep_unreachable_decisions(make_sim, run_sim):
+    class CachedLoadAware(CachedSelection, LoadAwareRouting):
+        pass
+
+    selector = CachedLoadAware()
+    s = make_sim([(0, 1), (1, 2), (3, 4)], {"A": [4], "B": [3]}, [(0, "M.U", 10)], selector=selector)
+    run_sim(s, 50)
+    assert selector.misses > 0
+    assert selector.hits == 0
+    assert not selector.decisions
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from yafs.metrics import Metrics
+from yafs.stats import Stats, StreamingStats
+
+
+@pytest.fixture
+def results(make_sim, run_sim, tmp_path):
+    """
+    The csv and npy results of the same simulation
+    """
+    paths = {}
+    for format in [Metrics.FORMAT_CSV, Metrics.FORMAT_NPY]:
+        path = str(tmp_path / format)
+        s = make_sim([(0, 1), (1, 2), (2, 3)], {"A": [1, 3], "B": [2]}, [(0, "M.U", 10), (3, "M.U", 15)],
+                     metrics=Metrics(default_results_path=path, format=format, chunk_size=13))
+        run_sim(s, 1000)
+        paths[format] = path
+    return paths
+
+
+@pytest.mark.parametrize("format", [Metrics.FORMAT_CSV, Metrics.FORMAT_NPY])
+@pytest.mark.parametrize("chunksize", [11, 1000000])
+def test_streaming_stats_are_the_same_as_stats(results, format, chunksize):
+    stats = Stats(defaultPath=results[format], format=format)
+    streaming = StreamingStats(defaultPath=results[format], format=format, chunksize=chunksize)
+    assert len(stats.df) > 0
+
+    for time in Stats.TIMES:
+        for value in ["mean", "sum", "count", "min", "max"]:
+            pd.testing.assert_frame_equal(stats.times(time, value), streaming.times(time, value), check_dtype=False)
+
+    assert streaming.bytes_transmitted() == stats.bytes_transmitted()
+    assert type(streaming.bytes_transmitted()) is type(stats.bytes_transmitted())
+    assert isinstance(streaming.bytes_transmitted(), (int, np.integer))
+    assert streaming.count_messages() == stats.count_messages()
+    assert streaming.average_messages_not_transmitted() == pytest.approx(stats.average_messages_not_transmitted())
+    assert streaming.peak_messages_not_transmitted() == stats.peak_messages_not_transmitted()
+    pd.testing.assert_series_equal(stats.messages_not_transmitted(), streaming.messages_not_transmitted(),
+                                   check_dtype=False)
+    des = stats.df["DES.dst"].iloc[0]
+    assert streaming.utilization(des, 1000) == pytest.approx(stats.utilization(des, 1000))
+    pd.testing.assert_frame_equal(stats.get_df_modules(), streaming.get_df_modules(), check_dtype=False)
+    assert stats.average_loop_response([["M.U", "M.A"]]) == pytest.approx(
+        streaming.average_loop_response([["M.U", "M.A"]]))
+
+
+def test_stats_times_are_the_same_as_the_records(results):
+    stats = Stats(defaultPath=results[Metrics.FORMAT_CSV])
+    df = pd.read_csv(results[Metrics.FORMAT_CSV] + ".csv")
+    expected = (df.time_out - df.time_reception).groupby(df.message).mean()
+    np.testing.assert_allclose(stats.times(Metrics.TIME_RESPONSE)[Metrics.TIME_RESPONSE].values, expected.values)
+
+
+@pytest.mark.parametrize("format", [Metrics.FORMAT_CSV, Metrics.FORMAT_NPY])
+def test_stats_without_records(tmp_path, format):
+    path = str(tmp_path / "empty")
+    Metrics(default_results_path=path, format=format).close()
+    for stats in [Stats(defaultPath=path, format=format), StreamingStats(defaultPath=path, format=format)]:
+        for value in ["mean", "sum", "count", "min", "max"]:
+            times = stats.times(Metrics.TIME_RESPONSE, value)
+            assert len(times) == 0
+            assert list(times.columns) == [Metrics.TIME_RESPONSE]
+        assert stats.average_loop_response([["M.U"]]) == [0.0]
+        assert len(stats.get_df_modules()) == 0
+        assert len(stats.get_df_service_utilization("A", 100)) == 0
+        assert len(stats.messages_not_transmitted()) == 0
+
+
+@pytest.mark.parametrize("format", [Metrics.FORMAT_CSV, Metrics.FORMAT_NPY])
+@pytest.mark.parametrize("chunksize", [5, 1000000])
+@pytest.mark.parametrize("time_loops", [None, [["M.U", "M.A"]], [["M.A"], [], ["M.U"]], [["M.X"]]])
+def test_streaming_request_latencies_are_the_same_as_stats(results, format, chunksize, time_loops):
+    stats = Stats(defaultPath=results[format], format=format)
+    streaming = StreamingStats(defaultPath=results[format], format=format, chunksize=chunksize)
+    expected = stats.request_latencies(time_loops)
+    requests = streaming.request_latencies(time_loops)
+    if time_loops != [["M.X"]]:
+        assert len(expected) > 0
+    pd.testing.assert_frame_equal(expected.reset_index(drop=True), requests, check_dtype=False)
+    pd.testing.assert_frame_equal(stats.end_to_end_latency(time_loops, deadlines={"app": 10}),
+                                  streaming.end_to_end_latency(time_loops, deadlines={"app": 10}), check_dtype=False)
+
+
+def test_request_latencies_follow_the_chain(results):
+    stats = Stats(defaultPath=results[Metrics.FORMAT_CSV])
+    df = stats.df
+    requests = stats.request_latencies().set_index("id")
+    for id, records in df[df.type == "COMP_M"].groupby("id"):
+        assert requests.loc[id, "start"] == records.time_emit.min()
+        assert requests.loc[id, "end"] == records.time_out.max()
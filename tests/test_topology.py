@@ -0,0 +1,101 @@
+import networkx as nx
+import pandas as pd
+import pytest
+
+from yafs.topology import Topology
+
+
+def _topology():
+    t = Topology()
+    t.load({"entity": [{"id": n, "RAM": 10, "IPT": 100, "type": "NODE"} for n in range(4)],
+            "link": [{"s": 0, "d": 1, "BW": 1, "PR": 1}, {"s": 1, "d": 2, "BW": 10, "PR": 5},
+                     {"s": 2, "d": 3, "BW": 4, "PR": 0}]})
+    return t
+
+
+def test_link_latency_is_the_transmission_plus_the_propagation():
+    t = _topology()
+    for (a, b, att) in t.G.edges(data=True):
+        expected = 100 / att[Topology.LINK_BW] + att[Topology.LINK_PR]
+        # Both directions share the same edge
+        assert t.get_link_latency((a, b), 100) == expected
+        assert t.get_link_latency((b, a), 100) == expected
+    assert t.get_link_latency((1, 2), 20) == 7
+
+
+def test_link_table_indexes_both_directions_of_each_edge():
+    t = _topology()
+    index, bw, pr = t.get_link_table()
+    assert len(index) == 2 * len(t.G.edges)
+    for (a, b, att) in t.G.edges(data=True):
+        assert index[a, b] == index[b, a]
+        assert bw[index[a, b]] == att[Topology.LINK_BW]
+        assert pr[index[a, b]] == att[Topology.LINK_PR]
+    # The table is built once
+    assert t.get_link_table()[0] is index
+
+
+def test_unknown_link_raises_key_error():
+    t = _topology()
+    with pytest.raises(KeyError):
+        t.get_link_latency((0, 2), 100)
+
+
+def test_latencies_are_memoized_until_the_table_is_invalidated():
+    t = _topology()
+    assert t.get_link_latency((0, 1), 100) == 101
+    # A direct change of G is not seen until invalidate_link_table is invoked
+    t.G.edges[0, 1][Topology.LINK_BW] = 100
+    assert t.get_link_latency((0, 1), 100) == 101
+    t.invalidate_link_table()
+    assert t.get_link_latency((0, 1), 100) == 2
+
+
+def test_graph_changes_invalidate_the_link_table():
+    t = _topology()
+    assert t.get_link_latency((2, 3), 100) == 25
+    t.remove_edge(2, 3)
+    with pytest.raises(KeyError):
+        t.get_link_latency((2, 3), 100)
+    t.add_edge(3, 2, BW=2, PR=1)
+    assert t.get_link_latency((2, 3), 100) == 51
+
+    t.remove_node(1)
+    with pytest.raises(KeyError):
+        t.get_link_latency((0, 1), 100)
+    assert t.get_link_latency((3, 2), 100) == 51
+
+    G = nx.Graph()
+    G.add_edge(0, 1, **{Topology.LINK_BW: 50, Topology.LINK_PR: 3})
+    t.create_topology_from_graph(G)
+    assert t.get_link_latency((1, 0), 100) == 5
+    with pytest.raises(KeyError):
+        t.get_link_latency((2, 3), 100)
+
+
+def test_a_replaced_graph_rebuilds_the_link_table():
+    t = _topology()
+    assert t.get_link_latency((0, 1), 100) == 101
+    G = nx.Graph()
+    G.add_edge(0, 1, **{Topology.LINK_BW: 10, Topology.LINK_PR: 0})
+    G.add_edge(1, 4, **{Topology.LINK_BW: 1, Topology.LINK_PR: 0})
+    t.G = G
+    assert t.get_link_latency((0, 1), 100) == 10
+    assert t.get_link_latency((4, 1), 100) == 100
+    with pytest.raises(KeyError):
+        t.get_link_latency((1, 2), 100)
+    assert len(t.get_link_table()[0]) == 4
+
+def test_simulation_uses_the_latency_of_each_link(make_sim, run_sim, tmp_path):
+    s = make_sim([(0, 1), (1, 2)], {"A": [2], "B": [2]}, [(0, "M.U", 1000)])
+    s.topology.G.edges[1, 2][Topology.LINK_BW] = 4
+    s.topology.G.edges[1, 2][Topology.LINK_PR] = 10
+    s.topology.invalidate_link_table()
+    run_sim(s, 3500)
+    links = pd.read_csv(str(tmp_path / "result_link.csv"))
+    latency = links.groupby(["src", "dst"]).latency.unique()
+    assert list(latency[(0, 1)]) == [101]
+    assert list(latency[(1, 2)]) == [35]
+    df = pd.read_csv(str(tmp_path / "result.csv"))
+    A = df[df.module == "A"]
+    assert (A.time_reception - A.time_emit == 101 + 35).all()
@@ -0,0 +1,58 @@
+import logging
+
+import numpy as np
+
+from yafs.link_buffer import TailDropBuffer
+from yafs.trace import EventTrace
+
+
+def test_ring_buffer_keeps_the_last_events(tmp_path):
+    trace = EventTrace(capacity=4)
+    for i in range(10):
+        trace.record(float(i), EventTrace.KIND_SEND, i, None if i % 2 else i, 1, 2)
+    events = trace.get_events()
+    assert trace.count == 10
+    assert events["id"].tolist() == [6, 7, 8, 9]
+    assert events["time"].tolist() == [6.0, 7.0, 8.0, 9.0]
+    assert events["DES"].tolist() == [6, -1, 8, -1]
+
+    path = str(tmp_path / "trace.npy")
+    trace.dump(path)
+    assert np.array_equal(np.load(path), events)
+
+    trace.clear()
+    assert len(trace.get_events()) == 0
+    trace.record(0.0, EventTrace.KIND_LOST, 1, 1)
+    assert trace.get_events()["kind"].tolist() == [EventTrace.KIND_LOST]
+
+
+def test_simulation_records_the_life_of_the_messages(make_sim, run_sim):
+    trace = EventTrace(capacity=100000)
+    s = make_sim([(0, 1), (1, 2)], {"A": [1], "B": [1]}, [(0, "M.U", 10)], trace=trace,
+                 link_buffer=TailDropBuffer(2))
+    run_sim(s, 1000)
+    events = trace.get_events()
+    kinds = set(events["kind"].tolist())
+    assert kinds == {EventTrace.KIND_SEND, EventTrace.KIND_LINK, EventTrace.KIND_DELIVER, EventTrace.KIND_DROP}
+    assert (np.diff(events["time"]) >= 0).all()
+
+    links = events[events["kind"] == EventTrace.KIND_LINK]
+    drops = events[events["kind"] == EventTrace.KIND_DROP]
+    assert set(zip(links["a"].tolist(), links["b"].tolist())) == {(0, 1)}
+    assert len(drops) == s.link_buffer.dropped
+    # A message is either transmitted or dropped
+    assert not set(links["id"].tolist()) & set(drops["id"].tolist())
+
+
+def test_debug_logging_does_not_change_the_results(make_sim, run_sim, tmp_path, caplog):
+    results = []
+    for level in [logging.INFO, logging.DEBUG]:
+        logger = logging.getLogger("yafs.core.test_%s" % level)
+        logger.setLevel(level)
+        s = make_sim([(0, 1), (1, 2), (2, 3)], {"A": [1], "B": [3]}, [(0, "M.U", 10)], logger=logger)
+        with caplog.at_level(level, logger=logger.name):
+            run_sim(s, 500)
+        with open(str(tmp_path / "result.csv")) as f:
+            results.append(f.read())
+    assert results[0] == results[1]
+    assert "SENDING Message" in caplog.text
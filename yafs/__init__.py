@@ -10,11 +10,15 @@ from pkgutil import extend_path
 
 from yafs.core import Sim
 from yafs.placement import Placement,ClusterPlacement
-from yafs.selection import Selection,OneRandomPath,First_ShortestPath
+from yafs.selection import Selection,OneRandomPath,First_ShortestPath,LoadAwareRouting,CachedSelection
 from yafs.topology import Topology
+from yafs.routing_table import RoutingTable
+from yafs.balancing import Balancer,RoundRobinBalancer,LeastOutstandingBalancer,PowerOfTwoBalancer
 from yafs.population import Population,Statical
 from yafs.application import Application, Message
 from yafs.metrics import Metrics
+from yafs.link_buffer import LinkBuffer,TailDropBuffer,REDBuffer
+from yafs.trace import EventTrace
 from yafs.distribution import *
 
 def compile_toc(entries, section_marker='='):
@@ -33,12 +37,15 @@ def compile_toc(entries, section_marker='='):
 
 toc = (
     ('Core', [Sim]),
-    ('Topology', [Topology]),
+    ('Topology', [Topology, RoutingTable]),
     ('Application', [Application, Message]),
     ('Population', [Population, Statical]),
     ('Placement', [Placement,ClusterPlacement]),
-    ('Selection', [Selection,OneRandomPath,First_ShortestPath]),
+    ('Selection', [Selection,OneRandomPath,First_ShortestPath,LoadAwareRouting,CachedSelection]),
+    ('Balancing', [Balancer,RoundRobinBalancer,LeastOutstandingBalancer,PowerOfTwoBalancer]),
     ('Metrics', [Metrics]),
+    ('Link buffer', [LinkBuffer,TailDropBuffer,REDBuffer]),
+    ('Trace', [EventTrace]),
     ('Distribution',[Distribution,deterministic_distribution,exponential_distribution])
 )
 
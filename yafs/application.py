@@ -23,9 +23,18 @@ class Message:
 
         dst_int (int): an identifier of the intermediate entity in which it is in the process of transmission.
 
+        hop (int): the position in *path* of the entity where the message is. It is the cursor of the transmission.
+
         app_name (str): the name of the application
+
+        multicast (tuple): the delivery tree when the message goes to several modules, see *Sim.__multicast_tree*. None for a single destination.
+
+    The attributes are slotted: a message is copied on every emission and every forward, so the instances are kept small and *copy.copy* is resolved by *__copy__*.
     """
 
+    __slots__ = ("name", "src", "dst", "inst", "bytes", "timestamp", "path", "dst_int", "hop", "app_name",
+                 "timestamp_rec", "idDES", "broadcasting", "last_idDes", "id", "original_DES_src", "multicast")
+
     def __init__(self, name, src, dst, instructions=0, bytes=0,broadcasting=False):
         self.name = name
         self.src = src
@@ -36,6 +45,7 @@ class Message:
         self.timestamp = 0
         self.path = []
         self.dst_int = -1
+        self.hop = 0
         self.app_name = None
         self.timestamp_rec = 0
 
@@ -45,6 +55,31 @@ class Message:
         self.id = -1
 
         self.original_DES_src = None #This attribute identifies the user when multiple users are in the same node
+        self.multicast = None
+
+    def __copy__(self):
+        """
+        A shallow copy: *path*, *last_idDes* and *multicast* are shared with the original message
+        """
+        msg = object.__new__(self.__class__)
+        msg.name = self.name
+        msg.src = self.src
+        msg.dst = self.dst
+        msg.inst = self.inst
+        msg.bytes = self.bytes
+        msg.timestamp = self.timestamp
+        msg.path = self.path
+        msg.dst_int = self.dst_int
+        msg.hop = self.hop
+        msg.app_name = self.app_name
+        msg.timestamp_rec = self.timestamp_rec
+        msg.idDES = self.idDES
+        msg.broadcasting = self.broadcasting
+        msg.last_idDes = self.last_idDes
+        msg.id = self.id
+        msg.original_DES_src = self.original_DES_src
+        msg.multicast = self.multicast
+        return msg
 
     def __str__(self):
         print  ("{--")
@@ -146,7 +181,7 @@ class Application:
             if type == self.TYPE_SOURCE:
                 self.modules_src.append(name)
             elif type == self.TYPE_SINK:
-                self.modules_sink = name
+                self.modules_sink.append(name)
 
             self.modules.append(name)
 
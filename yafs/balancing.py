@@ -0,0 +1,120 @@
+"""
+    A balancer chooses one replica among several ones with the same cost for a selection algorithm.
+
+    This type of algorithm have one obligatory function:
+
+        *choose*: it returns one of the candidates, each call costs O(1) (or O(candidates) at most)
+
+"""
+import random
+
+
+class Balancer(object):
+    """
+    It chooses the DES process that serves a message among equivalent replicas.
+
+    .. note:: A class interface
+    """
+
+    def choose(self, sim, app_name, service, candidates):
+        """
+        Args:
+            sim (:mod:`Sim`)
+
+            app_name (str): application name
+
+            service (str): module name
+
+            candidates (list): DES processes with the same cost
+
+        Returns:
+            one DES process of the candidates
+
+        .. attention:: override required
+        """
+        return candidates[0]
+
+    def clear(self):
+        """
+        Forgets the previous decisions
+        """
+        None
+
+
+class RoundRobinBalancer(Balancer):
+    """
+    It chooses the candidates in turn. Each group of candidates has its own turn.
+    """
+
+    def __init__(self):
+        self.turn = {}
+        # tuple of candidates -> index of the next one
+
+    def choose(self, sim, app_name, service, candidates):
+        group = tuple(candidates)
+        idx = self.turn.get(group, 0)
+        self.turn[group] = (idx + 1) % len(group)
+        return group[idx]
+
+    def clear(self):
+        self.turn = {}
+
+
+class OutstandingBalancer(Balancer):
+    """
+    It counts the outstanding messages of each candidate: the ones that it has chosen and that the module has not taken from its pipe yet, including the ones that are still crossing the network.
+    The simulation notifies the taken messages through *Sim.consumer_listeners*.
+    """
+
+    def __init__(self):
+        self.outstanding = {}
+        # DES process -> number of outstanding messages
+        self.sim = None
+
+    def dispatch(self, sim, des):
+        """
+        Counts a message towards the chosen candidate
+
+        Returns:
+            the candidate
+        """
+        if self.sim is not sim:
+            sim.consumer_listeners.append(self.taken)
+            self.sim = sim
+        self.outstanding[des] = self.outstanding.get(des, 0) + 1
+        return des
+
+    def taken(self, app_name, module, idDES):
+        """
+        The module of the DES process has taken a message of its pipe. The messages that did not go through this balancer are not counted.
+        """
+        count = self.outstanding.get(idDES, 0)
+        if count > 0:
+            self.outstanding[idDES] = count - 1
+
+    def clear(self):
+        self.outstanding = {}
+
+
+class LeastOutstandingBalancer(OutstandingBalancer):
+    """
+    It chooses the candidate with fewer outstanding messages. Ties are broken by order.
+    """
+
+    def choose(self, sim, app_name, service, candidates):
+        outstanding = self.outstanding
+        return self.dispatch(sim, min(candidates, key=lambda des: outstanding.get(des, 0)))
+
+
+class PowerOfTwoBalancer(OutstandingBalancer):
+    """
+    It takes two random candidates and chooses the one with fewer outstanding messages.
+    """
+
+    def choose(self, sim, app_name, service, candidates):
+        if len(candidates) < 2:
+            return self.dispatch(sim, candidates[0])
+        a, b = random.sample(candidates, 2)
+        if self.outstanding.get(b, 0) < self.outstanding.get(a, 0):
+            return self.dispatch(sim, b)
+        return self.dispatch(sim, a)
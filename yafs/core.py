@@ -17,6 +17,7 @@ import random
 from yafs.topology import Topology
 from yafs.application import Application
 from yafs.metrics import Metrics
+from yafs.trace import EventTrace
 from yafs.distribution import *
 
 EVENT_UP_ENTITY = "node_up"
@@ -40,6 +41,12 @@ class Sim:
 
        logger (logger) - logger
 
+       metrics (object) - a (:mod:`Metrics`) instance, i.e. with other format. By default, CSV files in *default_results_path*
+
+       link_buffer (object) - a (:mod:`LinkBuffer`) that bounds the queue of each link. By default, the queues are unbounded
+
+       trace (object) - an (:mod:`EventTrace`) that keeps the last events of the messages
+
 
     **Main variables to coordinate with algorithm:**
 
@@ -51,7 +58,13 @@ class Sim:
     SINK_METRIC = "SINK_M"
     LINK_METRIC = "LINK"
 
-    def __init__(self, topology, name_register='events_log.json', link_register='links_log.json', redis=None, purge_register=True, logger=None, default_results_path=None):
+    CHANGE_DEPLOY = "deploy"
+    CHANGE_UNDEPLOY = "undeploy"
+    CHANGE_REMOVE_NODE = "remove_node"
+    CHANGE_ADD_LINK = "add_link"
+    CHANGE_REMOVE_LINK = "remove_link"
+
+    def __init__(self, topology, name_register='events_log.json', link_register='links_log.json', redis=None, purge_register=True, logger=None, default_results_path=None, metrics=None, link_buffer=None, trace=None):
 
         self.env = simpy.Environment()
         """
@@ -68,6 +81,12 @@ class Sim:
         self.network_pump = 0
         # a shared resource that control the exchange of messagess in the topology
 
+        self.link_buffer = link_buffer
+        # the queues of the links and their dropped messages, see yafs.link_buffer
+
+        self.__link_waiters = {}
+        # link -> events of the sources blocked by the backpressure of the link, they are triggered when a transfer ends
+
         self.stop = False
         """
         Any algorithm can stop internally the simulation putting these value to True. By default is False.
@@ -75,11 +94,16 @@ class Sim:
 
         self.topology = topology
         self.logger = logger or logging.getLogger(__name__)
+
+        self.__debug = self.logger.isEnabledFor(logging.DEBUG)
+        # The level of the logger is checked once (and again in *run*), instead of formatting debug messages of each event
+
+        self.trace = trace
         self.apps = {}
 
         self.until = 0 #End time simulation
 
-        self.metrics = Metrics(default_results_path=default_results_path)
+        self.metrics = metrics or Metrics(default_results_path=default_results_path)
 
         self.unreachabled_links = 0
 
@@ -128,7 +152,7 @@ class Sim:
 
         self.consumer_pipes = {}
         # Queues for each message
-        # App+module+idDES -> pipe
+        # idDES -> pipe of the module deployed in that DES process
 
         self.alloc_module = {}
         """
@@ -154,6 +178,16 @@ class Sim:
 
         """
 
+        self.node_DES = {}
+        """
+        The reverse index of *alloc_DES*: topology.node.id -> set of DES processes deployed in it
+        """
+
+        self.module_DES = {}
+        """
+        (app.name, module, topology.node.id) -> list of DES processes of that module deployed in the node, in order of deployment
+        """
+
         self.selector_path = {}
         # Store for each app.name the selection policy
         # app.name -> Selector
@@ -162,6 +196,30 @@ class Sim:
         # This variable control the lag of each busy network links. It avoids the generation of a DES-process for each link
         # edge -> last_use_channel (float) = Simulation time
 
+        self.link_listeners = []
+        """
+        Functions *f(link, busy_time)* that are invoked each time that *last_busy_time* of a link is updated, i.e. by a selection algorithm that keeps aggregates of the occupancy of its routes
+        """
+
+        self.consumer_listeners = []
+        """
+        Functions *f(app_name, module, idDES)* that are invoked each time that a module or a sink takes a message of its pipe, i.e. by a balancer that counts the outstanding messages of each replica
+        """
+
+        self.version = 0
+        """
+        It increases with each change of the allocation of modules or of the topology. The selection algorithms compare it with the last one they saw to know if their caches are stale, and *get_changes* tells them what changed.
+        """
+
+        self.__des_module = []
+        # idDES -> (app.name, module) deployed in it, None for other DES processes. The ids of the DES processes are consecutive integers
+
+        self.__sink_modules = set()
+        # (app.name, module) of the sink modules
+
+        self.__changes = []
+        # (kind, value) for each version: CHANGE_DEPLOY and CHANGE_UNDEPLOY -> (app, module, DES), CHANGE_REMOVE_NODE -> node, CHANGE_ADD_LINK and CHANGE_REMOVE_LINK -> (src, dst)
+
 
 
     # self.__send_message(app_name, message, idDES, self.SOURCE_METRIC)
@@ -176,6 +234,9 @@ class Sim:
 
         Kwargs:
             id_src (int) identifier of a pure source module
+
+        Returns:
+            None, or an event if the message has not been sent due to the backpressure of its first link. The source has to wait for it and send the message again.
         """
         #TODO IMPROVE asignation of topo = alloc_DES(IdDES) , It has to move to the get_path process
         try:
@@ -194,23 +255,129 @@ class Sim:
                     if self.control_movement_class is not None:
                         self.logger.debug("STEP : ",self.control_movement_class.current_step)
 
+            elif self.link_buffer is not None and self.link_buffer.backpressure and type == self.SOURCE_METRIC \
+                    and paths and len(paths[0]) > 1 and self.link_buffer.is_blocked((paths[0][0], paths[0][1]), message.bytes):
+                # The source is blocked by the queue of its first link until one of its transfers ends
+                self.link_buffer.throttled += 1
+                if self.__debug:
+                    self.logger.debug("(#DES:%i)\t--- THROTTLED Message:\t%s", idDES, message.name)
+                event = self.env.event()
+                self.__link_waiters.setdefault((paths[0][0], paths[0][1]), []).append(event)
+                return event
+
             else:
 
-                self.logger.debug("(#DES:%i)\t--- SENDING Message:\t%s: PATH:%s  DES:%s" % (idDES, message.name,paths,DES_dst))
+                if self.__debug:
+                    self.logger.debug("(#DES:%i)\t--- SENDING Message:\t%s: PATH:%s  DES:%s", idDES, message.name,paths,DES_dst)
+                if self.trace is not None:
+                    self.trace.record(self.env.now, EventTrace.KIND_SEND, message.id, idDES, DES_dst[0] if DES_dst else -1, len(paths))
 
                 # print "MESSAGES"
                 #May be, the selector of path decides broadcasting multiples paths
-                for idx,path in enumerate(paths):
+                if len(paths) > 1 and all(paths) and all(path[0] == paths[0][0] for path in paths):
+                    # A single message travels through the common links and it is split where the paths diverge
                     msg = copy.copy(message)
-                    msg.path = copy.copy(path)
+                    msg.path = paths[0]
+                    msg.hop = 0
                     msg.app_name = app_name
-                    msg.idDES = DES_dst[idx]
-
+                    msg.idDES = DES_dst[0]
+                    msg.multicast = self.__multicast_tree(list(zip(paths, DES_dst)), 0)
                     self.network_ctrl_pipe.put(msg)
+                else:
+                    for idx,path in enumerate(paths):
+                        msg = copy.copy(message)
+                        # The path is only read by the network process (see message.hop), it is shared with the selector
+                        msg.path = path
+                        msg.hop = 0
+                        msg.app_name = app_name
+                        msg.idDES = DES_dst[idx]
+
+                        self.network_ctrl_pipe.put(msg)
         except KeyError:
             self.logger.warning("(#DES:%i)\t--- Unreacheable DST:\t%s " % (idDES, message.name))
 
 
+    def __multicast_tree(self, routes, start):
+        """
+        Builds the delivery tree of a message towards several modules. The routes share their nodes until *start*.
+
+        Args:
+            routes (list): (path, DES) pairs
+
+            start (int): position of the last common node
+
+        Returns:
+            a tuple (end, deliveries, branches): the routes share their nodes until the position *end* of the path. There, the message is delivered to the (path, DES) pairs of *deliveries* and it is copied for each (path, DES, tree) of *branches*, where tree is None if the branch only has one route.
+        """
+        end = start
+        while all(len(path) > end + 1 for path, des in routes) and \
+                all(path[end + 1] == routes[0][0][end + 1] for path, des in routes):
+            end += 1
+
+        deliveries = []
+        groups = {}
+        for path, des in routes:
+            if len(path) == end + 1:
+                deliveries.append((path, des))
+            else:
+                groups.setdefault(path[end + 1], []).append((path, des))
+
+        branches = []
+        for group in groups.values():
+            if len(group) == 1:
+                branches.append((group[0][0], group[0][1], None))
+            else:
+                branches.append((group[0][0], group[0][1], self.__multicast_tree(group, end + 1)))
+        return end, deliveries, branches
+
+    def __split_multicast(self, message):
+        """
+        The message is copied for each delivery and each branch of its tree at the current node
+        """
+        end, deliveries, branches = message.multicast
+        for path, des in deliveries:
+            msg = copy.copy(message)
+            msg.path = path
+            msg.idDES = des
+            msg.multicast = None
+            self.__deliver_message(msg)
+        for path, des, tree in branches:
+            msg = copy.copy(message)
+            msg.path = path
+            msg.idDES = des
+            msg.multicast = tree
+            self.network_ctrl_pipe.put(msg)
+
+    def __deliver_message(self, message):
+        """
+        The message has achieved the last node of its path and it is sent to the pipe of its module
+        """
+        # Timestamp reception message in the module
+        message.timestamp_rec = self.env.now
+        # The message is sent to the module.pipe
+        if self.trace is not None:
+            self.trace.record(self.env.now, EventTrace.KIND_DELIVER, message.id, message.idDES, message.path[-1] if message.path else -1)
+        try:
+            self.consumer_pipes[message.idDES].put(message)
+        except KeyError:
+            # The module has been removed with its node
+            if self.__debug:
+                self.logger.debug("The module of the message %s has been removed. Message is lost", message.name)
+
+    def __unfold_multicast(self, tree):
+        """
+        Returns:
+            the (path, DES) pairs of all the routes of the tree
+        """
+        end, deliveries, branches = tree
+        routes = list(deliveries)
+        for path, des, subtree in branches:
+            if subtree is None:
+                routes.append((path, des))
+            else:
+                routes.extend(self.__unfold_multicast(subtree))
+        return routes
+
     def __network_process(self):
         """
         This is an internal DES-process who manages the latency of messages sent in the network.
@@ -231,25 +398,19 @@ class Sim:
             # print "DST",message.dst
 
 
-            # If same SRC and PATH or the message has achieved the penultimate node to reach the dst
-            if not message.path or message.path[-1] == message.dst_int or len(message.path)==1:
+            # A message towards several modules is split where their paths diverge
+            if message.multicast is not None and message.hop >= message.multicast[0]:
+                self.__split_multicast(message)
 
-                pipe_id = "%s%s%i" %(message.app_name,message.dst,message.idDES)  # app_name + module_name (dst) + idDES
-                # Timestamp reception message in the module
-                message.timestamp_rec = self.env.now
-                # The message is sent to the module.pipe
-                self.consumer_pipes[pipe_id].put(message)
+            # If same SRC and PATH or the message has achieved the last node of the path
+            elif not message.path or message.hop >= len(message.path) - 1:
+                self.__deliver_message(message)
             else:
                 # The message is sent at first time or it sent more times.
-                # if message.dst_int < 0:
-
-                if (isinstance(message.dst_int , str) and len(message.dst_int ) == 0) or \
-                        (isinstance(message.dst_int , int) and message.dst_int  < 0):
-                    src_int = message.path[0]
-                    message.dst_int = message.path[1]
-                else:
-                    src_int = message.dst_int
-                    message.dst_int = message.path[message.path.index(message.dst_int) + 1]
+                # The hop cursor points to the entity where the message is
+                src_int = message.path[message.hop]
+                message.hop += 1
+                message.dst_int = message.path[message.hop]
                 # arista set by (src_int,message.dst_int)
                 link = (src_int, message.dst_int)
 
@@ -266,61 +427,96 @@ class Sim:
                 """
                 Computing message latency
                 """
-                size_bits = message.bytes
-                #size_bits = message.bytes * 8
                 try:
-                    transmit = size_bits / (self.topology.get_edge(link)[Topology.LINK_BW])
-                    # transmit = size_bits / (self.topology.get_edge(link)[Topology.LINK_BW] * 1000000.0)  # MBITS!
-                    propagation = self.topology.get_edge(link)[Topology.LINK_PR]
-                    latency_msg_link = transmit + propagation
-
-                    #print "-link: %s -- lat: %d" %(link,latency_msg_link)
-
-                    # update link metrics
-                    self.metrics.insert_link(
-                        {"id":message.id,"type": self.LINK_METRIC,"src":link[0],"dst":link[1],"app":message.app_name,"latency":latency_msg_link,"message": message.name,"ctime":self.env.now,"size":message.bytes,"buffer":self.network_pump})#"path":message.path})
-
-                    # We compute the future latency considering the current utilization of the link
-                    if last_used < self.env.now:
-                        shift_time = 0.0
-                        last_used = latency_msg_link + self.env.now  # future arrival time
-                    else:
-                        shift_time = last_used - self.env.now
-                        last_used = self.env.now + shift_time + latency_msg_link
-
-                    # print "Send next WakeUp : ", last_used
-                    # print "-" * 30
-
-                    self.last_busy_time[link] = last_used
-                    self.env.process(self.__wait_message(message, latency_msg_link, shift_time))
-                except:
+                    # The link table of the topology is compiled once and it memorizes each (link, message size) latency
+                    latency_msg_link = self.topology.get_link_latency(link, message.bytes)
+                except KeyError:
                     #This fact is produced when a node or edge the topology is changed or disappeared
                     self.logger.warning("The initial path assigned is unreachabled. Link: (%i,%i). Routing a new one. %i"%(link[0],link[1],self.env.now))
 
+                    if message.multicast is not None:
+                        # Each route of the tree is rerouted on its own
+                        for path, des in self.__unfold_multicast(message.multicast):
+                            msg = copy.copy(message)
+                            msg.path = path
+                            msg.idDES = des
+                            msg.multicast = None
+                            msg.hop = message.hop - 1
+                            self.network_ctrl_pipe.put(msg)
+                        continue
+
                     paths, DES_dst = self.selector_path[message.app_name].get_path_from_failure(self, message, link, self.alloc_DES,self.alloc_module, self.last_busy_time,self.env.now,from_des=message.idDES)
 
-                    if DES_dst == [] and paths==[]:
+                    if not paths or DES_dst == [None]:
                         #Message communication ending:
                         #The message have arrived to the destination node but it is unavailable.
                         None
-                        self.logger.debug("\t No path given. Message is lost")
+                        if self.__debug:
+                            self.logger.debug("\t No path given. Message is lost")
+                        if self.trace is not None:
+                            self.trace.record(self.env.now, EventTrace.KIND_LOST, message.id, message.idDES, link[0])
                     else:
 
                         message.path = copy.copy(paths[0])
                         message.idDES = DES_dst[0]
-                        self.logger.debug("(\t New path given. Message is enrouting again.")
+                        if self.__debug:
+                            self.logger.debug("(\t New path given. Message is enrouting again.")
                         # print "\t",msg.path
                         self.network_ctrl_pipe.put(message)
+                    continue
+
+                #print "-link: %s -- lat: %d" %(link,latency_msg_link)
+
+                if self.link_buffer is not None and not self.link_buffer.enqueue(link, message.bytes):
+                    if self.__debug:
+                        self.logger.debug("The message %s is dropped at the link (%i,%i). %i", message.name, link[0], link[1], self.env.now)
+                    if self.trace is not None:
+                        self.trace.record(self.env.now, EventTrace.KIND_DROP, message.id, message.idDES, link[0], link[1])
+                    continue
+
+                if self.trace is not None:
+                    self.trace.record(self.env.now, EventTrace.KIND_LINK, message.id, message.idDES, link[0], link[1])
+
+                # update link metrics
+                self.metrics.insert_link(
+                    {"id":message.id,"type": self.LINK_METRIC,"src":link[0],"dst":link[1],"app":message.app_name,"latency":latency_msg_link,"message": message.name,"ctime":self.env.now,"size":message.bytes,"buffer":self.network_pump})#"path":message.path})
+
+                # We compute the future latency considering the current utilization of the link
+                if last_used < self.env.now:
+                    shift_time = 0.0
+                    last_used = latency_msg_link + self.env.now  # future arrival time
+                else:
+                    shift_time = last_used - self.env.now
+                    last_used = self.env.now + shift_time + latency_msg_link
+
+                # print "Send next WakeUp : ", last_used
+                # print "-" * 30
+
+                self.last_busy_time[link] = last_used
+                for listener in self.link_listeners:
+                    listener(link, last_used)
+                self.__schedule_link_transfer(message, latency_msg_link + shift_time, link)
 
 
 
-    def __wait_message(self, msg, latency, shift_time):
+    def __schedule_link_transfer(self, msg, delay, link):
         """
-        Simulates the transfer behavior of a message on a link
+        Simulates the transfer behavior of a message on a link.
+
+        Instead of a DES-process per hop, the end of the transfer is a timeout event with a plain callback that puts the message back in the network pipe.
         """
         self.network_pump += 1
-        yield self.env.timeout(latency + shift_time)
+        transfer = self.env.timeout(delay)
+        transfer.callbacks.append(lambda event: self.__end_link_transfer(msg, link))
+
+    def __end_link_transfer(self, msg, link):
         self.network_pump -= 1
+        if self.link_buffer is not None:
+            self.link_buffer.dequeue(link, msg.bytes)
+            waiters = self.__link_waiters.pop(link, None)
+            if waiters:
+                for event in waiters:
+                    event.succeed()
         self.network_ctrl_pipe.put(msg)
 
     def __get_id_process(self):
@@ -356,7 +552,8 @@ class Sim:
         while not self.stop and self.des_process_running[myId]:
             yield self.env.timeout(placement.get_next_activation())
             placement.run(self)
-            self.logger.debug("(DES:%i) %7.4f Run - Placement Policy: %s " % (myId, self.env.now, self.stop))  # Rewrite
+            if self.__debug:
+                self.logger.debug("(DES:%i) %7.4f Run - Placement Policy: %s ", myId, self.env.now, self.stop)  # Rewrite
         self.logger.debug("STOP_Process - Placement Algorithm\t#DES:%i" % myId)
 
     def __add_population_process(self, population):
@@ -370,7 +567,8 @@ class Sim:
         self.logger.debug("Added_Process - Population Algorithm\t#DES:%i" % myId)
         while not self.stop and self.des_process_running[myId]:
             yield self.env.timeout(population.get_next_activation())
-            self.logger.debug("(DES:%i) %7.4f Run - Population Policy: %s " % (myId, self.env.now, self.stop))  # REWRITE
+            if self.__debug:
+                self.logger.debug("(DES:%i) %7.4f Run - Population Policy: %s ", myId, self.env.now, self.stop)  # REWRITE
             population.run(self)
         self.logger.debug("STOP_Process - Population Algorithm\t#DES:%i" % myId)
 
@@ -387,13 +585,19 @@ class Sim:
             nextTime = distribution.next()
             yield self.env.timeout(nextTime)
             if self.des_process_running[idDES]:
-                self.logger.debug("(App:%s#DES:%i)\tModule - Generating Message: %s \t(T:%d)" % (name_app, idDES, message.name,self.env.now))
+                if self.__debug:
+                    self.logger.debug("(App:%s#DES:%i)\tModule - Generating Message: %s \t(T:%d)", name_app, idDES, message.name,self.env.now)
 
                 msg = copy.copy(message)
                 msg.timestamp = self.env.now
                 msg.id = self.__getIDMessage()
                 msg.original_DES_src = idDES
-                self.__send_message(name_app, msg, idDES, self.SOURCE_METRIC)
+                blocked = self.__send_message(name_app, msg, idDES, self.SOURCE_METRIC)
+                while blocked is not None and self.des_process_running[idDES]:
+                    # The next emission is delayed until the message is sent
+                    yield blocked
+                    msg.timestamp = self.env.now
+                    blocked = self.__send_message(name_app, msg, idDES, self.SOURCE_METRIC)
 
         self.logger.debug("STOP_Process - Module Pure Source\t#DES:%i" % idDES)
 
@@ -402,7 +606,7 @@ class Sim:
             """
             It computes the service time in processing a message and record this event
             """
-            if module in self.apps[app].get_sink_modules():
+            if self.__des_module[des] in self.__sink_modules:
                 """
                 The module is a SINK (Actuactor)
                 """
@@ -455,18 +659,16 @@ class Sim:
 
 
             sourceDES = -1
-            try:
+            if message.src not in self.alloc_module[app]:
+                #The message comes from a SRC.entity (an user)
+                sourceDES = message.original_DES_src
+            else:
                 # WARNING.
-                # ONLY IN THIS CASE (Try)
                 # If there are more than two equal modules deployed in the same entity, it will not be possible to determine which process sent this package at this point. That information will have to be calculated by the trace of the message (message.id)
                 #TODO fix this problem
-                DES_possible = self.alloc_module[app][message.src]
-                for eDES in DES_possible:
-                    if self.alloc_DES[eDES] == message.path[0]:
-                        sourceDES = eDES
-            except:
-                #The message comes from a SRC.entity (an user)
-                sourceDES = message.original_DES_src
+                in_node = self.module_DES.get((app, message.src, message.path[0]))
+                if in_node:
+                    sourceDES = in_node[-1]
 
             # print "Source DES ",sourceDES
             # print "-" * 50
@@ -504,7 +706,8 @@ class Sim:
         while not self.stop:
             # TODO Define function to ADD a new NODE in topology
             yield self.env.timeout(next_event(**param))
-            self.logger.debug("(DES:%i) %7.4f Node " % (myId, self.env.now))
+            if self.__debug:
+                self.logger.debug("(DES:%i) %7.4f Node ", myId, self.env.now)
         self.logger.debug("STOP_Process - UP entity Creation\t#DES%i" % myId)
 
     """
@@ -517,7 +720,8 @@ class Sim:
         self.logger.debug("Added_Process - Down entity Creation\t#DES:%i" % myId)
         while not self.stop and self.des_process_running[myId]:
             yield self.env.timeout(next_event(**param))
-            self.logger.debug("(DES:%i) %7.4f Node " % (myId, self.env.now))
+            if self.__debug:
+                self.logger.debug("(DES:%i) %7.4f Node ", myId, self.env.now)
 
         self.logger.debug("STOP_Process - Down entity Creation\t#DES%i" % myId)
 
@@ -529,126 +733,127 @@ class Sim:
         while (not self.stop) and self.des_process_running[idDES]:
             yield self.env.timeout(distribution.next())
             if self.des_process_running[idDES]:
-                self.logger.debug(
-                    "(App:%s#DES:%i#%s)\tModule - Generating Message:\t%s" % (app_name, idDES, module, message.name))
+                if self.__debug:
+                    self.logger.debug("(App:%s#DES:%i#%s)\tModule - Generating Message:\t%s", app_name, idDES, module, message.name)
                 msg = copy.copy(message)
                 msg.timestamp = self.env.now
                 msg.original_DES_src = idDES
 
-                self.__send_message(app_name, msg, idDES,self.SOURCE_METRIC)
+                blocked = self.__send_message(app_name, msg, idDES,self.SOURCE_METRIC)
+                while blocked is not None and self.des_process_running[idDES]:
+                    # The next emission is delayed until the message is sent
+                    yield blocked
+                    msg.timestamp = self.env.now
+                    blocked = self.__send_message(app_name, msg, idDES, self.SOURCE_METRIC)
 
         self.logger.debug("STOP_Process - Module Source: %s\t#DES:%i" % (module, idDES))
 
 
-    def __add_consumer_module(self, ides, app_name, module, register_consumer_msg):
+    def __add_consumer_module(self, ides, app_name, module, handlers, pipe):
         """
         It generates a DES process associated to a compute module
+
+        Args:
+            handlers (dict): name of an input message -> the transmissions of the module for that message (see *__compile_handlers*)
+
+            pipe (*simpy.Store*): the queue of the module
         """
         self.logger.debug("Added_Process - Module Consumer: %s\t#DES:%i" % (module, ides))
         while not self.stop and self.des_process_running[ides]:
             if self.des_process_running[ides]:
-                msg = yield self.consumer_pipes["%s%s%i"%(app_name,module,ides)].get()
+                msg = yield pipe.get()
                 # One pipe for each module name
+                for listener in self.consumer_listeners:
+                    listener(app_name, module, ides)
 
-                m = self.apps[app_name].services[module]
-
-                # for ser in m:
-                #     if "message_in" in ser.keys():
-                #         try:
-                #             print "\t\t M_In: %s  -> M_Out: %s " % (ser["message_in"].name, ser["message_out"].name)
-                #         except:
-                #             print "\t\t M_In: %s  -> M_Out: [NOTHING] " % (ser["message_in"].name)
-
-                # print "Registers len: %i" %len(register_consumer_msg)
                 doBefore = False
-                for register in register_consumer_msg:
-                    if msg.name == register["message_in"].name:
-                        # The message can be treated by this module
+                for register in handlers.get(msg.name, ()):
+                    # The message can be treated by this module
+                    """
+                    Processing the message
+                    """
+                    # if ides == 3:
+                    #     print "Consumer Message: %d " % self.env.now
+                    #     print "MODULE DES: ",ides
+                    #     print "id ",msg.id
+                    #     print "name ",msg.name
+                    #     print msg.path
+                    #     print msg.dst_int
+                    #     print msg.timestamp
+                    #     print msg.dst
+                    #
+                    #     print "-" * 30
+
+                    #The module only computes this type of message one time.
+                    #It records once
+                    if not doBefore:
+                        if self.__debug:
+                            self.logger.debug("(App:%s#DES:%i#%s)\tModule - Recording the message:\t%s", app_name, ides, module, msg.name)
+                        type = self.NODE_METRIC
+
+                        service_time = self.__update_node_metrics(app_name, module, msg, ides, type)
+
+                        yield self.env.timeout(service_time)
+                        doBefore = True
+
+                    """
+                    Transferring the message
+                    """
+                    if not register["message_out"]:
                         """
-                        Processing the message
+                        Sink behaviour (nothing to send)
                         """
-                        # if ides == 3:
-                        #     print "Consumer Message: %d " % self.env.now
-                        #     print "MODULE DES: ",ides
-                        #     print "id ",msg.id
-                        #     print "name ",msg.name
-                        #     print msg.path
-                        #     print msg.dst_int
-                        #     print msg.timestamp
-                        #     print msg.dst
-                        #
-                        #     print "-" * 30
-
-                        #The module only computes this type of message one time.
-                        #It records once
-                        if not doBefore:
-                            self.logger.debug(
-                                "(App:%s#DES:%i#%s)\tModule - Recording the message:\t%s" % (app_name, ides, module, msg.name))
-                            type = self.NODE_METRIC
-
-                            service_time = self.__update_node_metrics(app_name, module, msg, ides, type)
-
-                            yield self.env.timeout(service_time)
-                            doBefore = True
+                        if self.__debug:
+                            self.logger.debug("(App:%s#DES:%i#%s)\tModule - Sink Message:\t%s", app_name, ides, module, msg.name)
+                        continue
+                    else:
+                        if register["dist"](**register["param"]): ### THRESHOLD DISTRIBUTION to Accept the message from source
+                            if not register["module_dest"]:
+                                # it is not a broadcasting message
+                                if self.__debug:
+                                    self.logger.debug("(App:%s#DES:%i#%s)\tModule - Transmit Message:\t%s", app_name, ides, module, register["message_out"].name)
+
+                                msg_out = copy.copy(register["message_out"])
+                                msg_out.timestamp = self.env.now
+                                msg_out.id = msg.id
+                                msg_out.last_idDes = msg.last_idDes + [ides]
 
-                        """
-                        Transferring the message
-                        """
-                        if not register["message_out"]:
-                            """
-                            Sink behaviour (nothing to send)
-                            """
-                            self.logger.debug(
-                                "(App:%s#DES:%i#%s)\tModule - Sink Message:\t%s" % (app_name, ides, module, msg.name))
-                            continue
-                        else:
-                            if register["dist"](**register["param"]): ### THRESHOLD DISTRIBUTION to Accept the message from source
-                                if not register["module_dest"]:
-                                    # it is not a broadcasting message
-                                    self.logger.debug("(App:%s#DES:%i#%s)\tModule - Transmit Message:\t%s" % (
-                                        app_name, ides, module, register["message_out"].name))
-
-                                    msg_out = copy.copy(register["message_out"])
-                                    msg_out.timestamp = self.env.now
-                                    msg_out.id = msg.id
-                                    msg_out.last_idDes = copy.copy(msg.last_idDes)
-                                    msg_out.last_idDes.append(ides)
-
-
-                                    self.__send_message(app_name, msg_out,ides, self.FORWARD_METRIC)
-
-                                else:
-                                    # it is a broadcasting message
-                                    self.logger.debug("(App:%s#DES:%i#%s)\tModule - Broadcasting Message:\t%s" % (
-                                        app_name, ides, module, register["message_out"].name))
-
-                                    msg_out = copy.copy(register["message_out"])
-                                    msg_out.timestamp = self.env.now
-                                    msg_out.last_idDes = copy.copy(msg.last_idDes)
-                                    msg_out.id = msg.id
-                                    msg_out.last_idDes = msg.last_idDes.append(ides)
-                                    for idx, module_dst in enumerate(register["module_dest"]):
-                                        if random.random() <= register["p"][idx]:
-                                            self.__send_message(app_name, msg_out, ides,self.FORWARD_METRIC)
+
+                                self.__send_message(app_name, msg_out,ides, self.FORWARD_METRIC)
 
                             else:
-                                self.logger.debug("(App:%s#DES:%i#%s)\tModule - Stopped Message:\t%s" % (
-                                    app_name, ides, module, register["message_out"].name))
+                                # it is a broadcasting message
+                                if self.__debug:
+                                    self.logger.debug("(App:%s#DES:%i#%s)\tModule - Broadcasting Message:\t%s", app_name, ides, module, register["message_out"].name)
+
+                                msg_out = copy.copy(register["message_out"])
+                                msg_out.timestamp = self.env.now
+                                msg_out.id = msg.id
+                                msg_out.last_idDes = msg.last_idDes + [ides]
+                                for idx, module_dst in enumerate(register["module_dest"]):
+                                    if random.random() <= register["p"][idx]:
+                                        self.__send_message(app_name, msg_out, ides,self.FORWARD_METRIC)
+
+                        else:
+                            if self.__debug:
+                                self.logger.debug("(App:%s#DES:%i#%s)\tModule - Stopped Message:\t%s", app_name, ides, module, register["message_out"].name)
 
         self.logger.debug("STOP_Process - Module Consumer: %s\t#DES:%i" % (module, ides))
 
-    def __add_sink_module(self, ides, app_name, module):
+    def __add_sink_module(self, ides, app_name, module, pipe):
         """
         It generates a DES process associated to a SINK module
         """
         self.logger.debug("Added_Process - Module Pure Sink: %s\t#DES:%i" % (module, ides))
         while not self.stop and self.des_process_running[ides]:
-            msg = yield self.consumer_pipes["%s%s%i" % (app_name, module, ides)].get()
+            msg = yield pipe.get()
+            for listener in self.consumer_listeners:
+                listener(app_name, module, ides)
             """
             Processing the message
             """
-            self.logger.debug(
-                "(App:%s#DES:%i#%s)\tModule Pure - Sink Message:\t%s" % (app_name, ides, module, msg.name))
+            if self.__debug:
+                self.logger.debug("(App:%s#DES:%i#%s)\tModule Pure - Sink Message:\t%s", app_name, ides, module, msg.name)
             type = self.SINK_METRIC
             service_time = self.__update_node_metrics(app_name, module, msg, ides, type)
             yield self.env.timeout(service_time)  # service time is 0
@@ -685,7 +890,18 @@ class Sim:
     def __add_consumer_service_pipe(self,app_name,module,idDES):
         self.logger.debug("Creating PIPE: %s%s%i "%(app_name,module,idDES))
 
-        self.consumer_pipes["%s%s%i"%(app_name,module,idDES)] = simpy.Store(self.env)
+        pipe = self.consumer_pipes[idDES] = simpy.Store(self.env)
+        return pipe
+
+    def __compile_handlers(self, register_consumer_msg):
+        """
+        Returns:
+            a dict with the transmissions of a module by the name of their input message, so each message is dispatched without scanning all of them
+        """
+        handlers = {}
+        for register in register_consumer_msg:
+            handlers.setdefault(register["message_in"].name, []).append(register)
+        return handlers
 
 
 
@@ -717,10 +933,65 @@ class Sim:
             None
 
 
+    def __index_DES(self, idDES, id_node, app_name=None, module=None):
+        """
+        Allocates the DES process in the node and updates the reverse indexes. The module is None for sources
+        """
+        self.alloc_DES[idDES] = id_node
+        self.node_DES.setdefault(id_node, set()).add(idDES)
+        if module is not None:
+            self.module_DES.setdefault((app_name, module, id_node), []).append(idDES)
+
+    def __unindex_DES(self, idDES):
+        """
+        Removes the allocation of the DES process and its entries in the reverse indexes
+        """
+        id_node = self.alloc_DES.pop(idDES)
+        node_des = self.node_DES[id_node]
+        node_des.discard(idDES)
+        if not node_des:
+            del self.node_DES[id_node]
+        app_module = self.__get_DES_module(idDES)
+        if app_module is not None:
+            key = (app_module[0], app_module[1], id_node)
+            module_des = self.module_DES.get(key, [])
+            if idDES in module_des:
+                module_des.remove(idDES)
+                if not module_des:
+                    del self.module_DES[key]
+
+    def __get_DES_module(self, idDES):
+        """
+        Returns:
+            the (app.name, module) deployed in the DES process, None for other processes
+        """
+        if idDES < len(self.__des_module):
+            return self.__des_module[idDES]
+        return None
+
+    def __set_des_module(self, idDES, app_name, module):
+        if len(self.__des_module) <= idDES:
+            self.__des_module.extend([None] * (idDES + 1 - len(self.__des_module)))
+        self.__des_module[idDES] = (app_name, module)
+
+    def __register_change(self, kind, value):
+        self.__changes.append((kind, value))
+        self.version = len(self.__changes)
+
     """
     SECTION FOR PUBLIC METHODS
     """
 
+    def get_changes(self, since):
+        """
+        Args:
+            since (int): a previous value of *version*
+
+        Returns:
+            a list of (kind, value) with the changes after that version, see CHANGE_* constants
+        """
+        return self.__changes[since:]
+
     def get_DES(self,name):
         return self.des_control_process[name]
 
@@ -778,7 +1049,7 @@ class Sim:
         idDES = self.__get_id_process()
         self.des_process_running[idDES] = True
         self.env.process(self.__add_source_population(idDES, app_name, msg, distribution))
-        self.alloc_DES[idDES] = id_node
+        self.__index_DES(idDES, id_node)
         self.alloc_source[idDES] = {"id":id_node,"app":app_name,"module":msg.src,"name":msg.name}
         return idDES
 
@@ -806,7 +1077,8 @@ class Sim:
         idDES = self.__get_id_process()
         self.des_process_running[idDES] = True
         self.env.process(self.__add_source_module(idDES, app_name, module,msg, distribution))
-        self.alloc_DES[idDES] = id_node
+        self.__set_des_module(idDES, app_name, module)
+        self.__index_DES(idDES, id_node)
         return idDES
 
     # idsrc = sim.deploy_module(app_name, module, id_node, register_consumer_msg)
@@ -833,14 +1105,16 @@ class Sim:
         """
         idDES = self.__get_id_process()
         self.des_process_running[idDES] = True
-        self.env.process(self.__add_consumer_module(idDES,app_name, module,register_consumer_msg))
         # To generate the QUEUE of a SERVICE module
-        self.__add_consumer_service_pipe(app_name, module, idDES)
+        pipe = self.__add_consumer_service_pipe(app_name, module, idDES)
+        self.__set_des_module(idDES, app_name, module)
+        self.env.process(self.__add_consumer_module(idDES,app_name, module,self.__compile_handlers(register_consumer_msg),pipe))
 
-        self.alloc_DES[idDES] = id_node
+        self.__index_DES(idDES, id_node, app_name, module)
         if module not in self.alloc_module[app_name]:
             self.alloc_module[app_name][module] = []
         self.alloc_module[app_name][module].append(idDES)
+        self.__register_change(self.CHANGE_DEPLOY, (app_name, module, idDES))
 
         return idDES
 
@@ -860,14 +1134,16 @@ class Sim:
         """
         idDES = self.__get_id_process()
         self.des_process_running[idDES] = True
-        self.alloc_DES[idDES] = node
-        self.__add_consumer_service_pipe(app_name, module, idDES)
+        pipe = self.__add_consumer_service_pipe(app_name, module, idDES)
+        self.__set_des_module(idDES, app_name, module)
+        self.__index_DES(idDES, node, app_name, module)
         # Update the relathionships among module-entity
         if app_name in self.alloc_module:
             if module not in self.alloc_module[app_name]:
                 self.alloc_module[app_name][module] = []
         self.alloc_module[app_name][module].append(idDES)
-        self.env.process(self.__add_sink_module(idDES,app_name, module))
+        self.__register_change(self.CHANGE_DEPLOY, (app_name, module, idDES))
+        self.env.process(self.__add_sink_module(idDES,app_name, module, pipe))
 
 
 
@@ -904,6 +1180,7 @@ class Sim:
         """
         # Application
         self.apps[app.name] = app
+        self.__sink_modules.update((app.name, module) for module in app.get_sink_modules())
 
         # Initialization
         self.alloc_module[app.name] = {}
@@ -935,6 +1212,7 @@ class Sim:
         """
         # Application
         self.apps[app.name] = app
+        self.__sink_modules.update((app.name, module) for module in app.get_sink_modules())
     
         # Initialization
         self.alloc_module[app.name] = {}
@@ -1026,17 +1304,12 @@ class Sim:
         from app_name
         deployed in id_topo
         """
-        all_des = []
-        for k, v in self.alloc_DES.items():
-            if v == idtopo:
-                all_des.append(k)
-
         # Clearing related structures
-        for des in self.alloc_module[app_name][service_name]:
-            if des in all_des:
-                self.alloc_module[app_name][service_name].remove(des)
-                self.stop_process(des)
-                del self.alloc_DES[des]
+        for des in list(self.module_DES.get((app_name, service_name, idtopo), [])):
+            self.alloc_module[app_name][service_name].remove(des)
+            self.stop_process(des)
+            self.__unindex_DES(des)
+            self.__register_change(self.CHANGE_UNDEPLOY, (app_name, service_name, des))
 
     def undeploy_source(self, des):
         """ remove one source deployed in a node
@@ -1047,7 +1320,7 @@ class Sim:
         if des in self.alloc_source:
             self.stop_process(des)
             del self.alloc_source[des]
-            del self.alloc_DES[des]
+            self.__unindex_DES(des)
 
 
     def undeploy_module(self, app_name,service_name, des):
@@ -1060,36 +1333,104 @@ class Sim:
             if d == des:
                 self.alloc_module[app_name][service_name].remove(des)
                 self.stop_process(des)
-                del self.alloc_DES[des]
+                self.__unindex_DES(des)
+                self.__register_change(self.CHANGE_UNDEPLOY, (app_name, service_name, des))
                 break
 
     def remove_node(self, id_node_topology):
-        # Stopping related processes deployed in the module and clearing main structure: alloc_DES
-        des_tmp=[]
-        if id_node_topology in self.alloc_DES.values():
-            for k, v in self.alloc_DES.items():
-                if v == id_node_topology:
-                    des_tmp.append(k)
-                    self.stop_process(k)
-                    del self.alloc_DES[k]
-                    break
-
-        # Clearing other related structures
-        for k, v in self.alloc_module.items():
-            for k2, v2 in self.alloc_module[k].items():
-                for item in des_tmp:
-                    if item in v2:
-                        v2.remove(item)
+        """
+        Removes a node of the topology and everything that is deployed in it: all its DES processes (modules, sinks and sources), their pipes and the queues of its links
+
+        Args:
+            id_node_topology (int): node identifier
+
+        Returns:
+            a dict with what was removed:
+
+            .. code-block:: python
+
+                {"node": 3, "modules": [(app_name, module, idDES), ...], "sources": [idDES, ...],
+                 "messages": number of messages lost in the pipes of the modules, "links": number of links}
+
+            The modules are the consumer and sink DES processes; the sources are the pure sources (see *deploy_source*) and the DES processes that generate the messages of a module
+        """
+        summary = {"node": id_node_topology, "modules": [], "sources": [], "messages": 0, "links": 0}
+
+        # Stopping related processes deployed in the node and clearing main structures
+        for des in sorted(self.node_DES.get(id_node_topology, ())):
+            self.stop_process(des)
+            if des in self.consumer_pipes:
+                app_name, module = self.__get_DES_module(des)
+                if des in self.alloc_module[app_name].get(module, []):
+                    self.alloc_module[app_name][module].remove(des)
+                summary["modules"].append((app_name, module, des))
+                summary["messages"] += len(self.consumer_pipes.pop(des).items)
+            else:
+                # A pure source or the source of a module
+                self.alloc_source.pop(des, None)
+                summary["sources"].append(des)
+            self.__unindex_DES(des)
+
+        # The queues of the links of the node
+        for neighbor in list(self.topology.G.adj[id_node_topology]):
+            summary["links"] += 1
+            self.last_busy_time.pop((id_node_topology, neighbor), None)
+            self.last_busy_time.pop((neighbor, id_node_topology), None)
 
         # Finally removing node from topology
-        self.topology.G.remove_node(id_node_topology)
+        self.topology.remove_node(id_node_topology)
+        for app_name, module, des in summary["modules"]:
+            self.__register_change(self.CHANGE_UNDEPLOY, (app_name, module, des))
+        self.__register_change(self.CHANGE_REMOVE_NODE, id_node_topology)
+        return summary
+
+    def add_link(self, src, dst, BW, PR):
+        """
+        Add a link in the topology during the simulation
+
+        Args:
+            src (int): node identifier
+
+            dst (int): node identifier
+
+            BW (float): bandwidth
 
+            PR (float): propagation delay
+        """
+        self.topology.add_edge(src, dst, BW, PR)
+        self.__register_change(self.CHANGE_ADD_LINK, (src, dst))
+
+    def remove_link(self, src, dst):
+        """
+        Remove a link of the topology during the simulation. The messages that are crossing it are rerouted by the selection algorithm (see *get_path_from_failure*)
+
+        Args:
+            src (int): node identifier
+
+            dst (int): node identifier
+        """
+        self.topology.remove_edge(src, dst)
+        self.__register_change(self.CHANGE_REMOVE_LINK, (src, dst))
+
+
+    def get_consumer_backlog(self, app_name, module, idDES):
+        """
+        Args:
+            app_name (str): application name
+
+            module (str): module name
+
+            idDES (int): the DES process of the module
+
+        Returns:
+            the number of messages waiting in the pipe of the module
+        """
+        return len(self.consumer_pipes[idDES].items)
 
     def get_DES_from_Service_In_Node(self, node, app_name, service):
-        deployed = self.alloc_module[app_name][service]
-        for des in deployed:
-            if self.alloc_DES[des] == node:
-                return des
+        deployed = self.module_DES.get((app_name, service, node))
+        if deployed:
+            return deployed[0]
         return []
 
     def get_assigned_structured_modules_from_DES(self):
@@ -1162,7 +1503,9 @@ class Sim:
         #     self.update_service_coverage()
 
 
-        self.print_debug_assignaments()
+        self.__debug = self.logger.isEnabledFor(logging.DEBUG)
+        if self.__debug:
+            self.print_debug_assignaments()
 
 
         """
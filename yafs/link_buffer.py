@@ -0,0 +1,144 @@
+"""
+    A link buffer bounds the messages that are waiting or in transmission in each link of the topology.
+
+    Without a buffer, the transmissions are queued without limit (see *Sim.last_busy_time*). With a buffer, a message that does not fit in the link is dropped.
+
+    This type of algorithm have one obligatory function:
+
+        *accept*: it decides if a message enters in the queue of a link
+
+"""
+import random
+
+
+class LinkBuffer(object):
+    """
+    The queue of each link is measured in bytes or in packets (messages). Each link direction has its own queue.
+
+    .. note:: A class interface
+
+    Args:
+        capacity (int): the size of the buffer of each link
+
+    Kwargs:
+        unit (str): UNIT_PACKETS or UNIT_BYTES
+
+        backpressure (bool): when the first link of its path is full, a source waits until a transfer of that link ends instead of sending the message to be dropped. Its next emissions are delayed as well.
+    """
+
+    UNIT_PACKETS = "packets"
+    UNIT_BYTES = "bytes"
+
+    def __init__(self, capacity, unit=UNIT_PACKETS, backpressure=False):
+        self.capacity = capacity
+        self.unit = unit
+        self.backpressure = backpressure
+
+        self.queued = {}
+        # link -> occupation of the queue in the unit of the buffer
+        self.drops = {}
+        # link -> number of dropped messages
+        self.dropped = 0
+        self.throttled = 0
+        # number of times that a source has been blocked by the backpressure
+
+    def amount(self, size):
+        if self.unit == self.UNIT_BYTES:
+            return size
+        return 1
+
+    def accept(self, link, queued, amount):
+        """
+        Args:
+            link (tuple): the link
+
+            queued (int): the current occupation of the queue
+
+            amount (int): the occupation of the message
+
+        Returns:
+            True if the message enters in the queue
+
+        .. attention:: override required
+        """
+        return True
+
+    def is_full(self, link, size):
+        """
+        Returns:
+            True if a message of that size does not fit in the queue of the link
+        """
+        return self.queued.get(link, 0) + self.amount(size) > self.capacity
+
+    def is_blocked(self, link, size):
+        """
+        Returns:
+            True if a source has to wait to send a message of that size through the link: the queue is full and some transfer will release it
+        """
+        return self.queued.get(link, 0) > 0 and self.is_full(link, size)
+
+    def enqueue(self, link, size):
+        """
+        Returns:
+            True if the message enters in the queue of the link. Otherwise, it is counted as dropped.
+        """
+        amount = self.amount(size)
+        queued = self.queued.get(link, 0)
+        if queued + amount > self.capacity or not self.accept(link, queued, amount):
+            self.drops[link] = self.drops.get(link, 0) + 1
+            self.dropped += 1
+            return False
+        self.queued[link] = queued + amount
+        return True
+
+    def dequeue(self, link, size):
+        """
+        The transmission of the message through the link has ended
+        """
+        self.queued[link] -= self.amount(size)
+
+
+class TailDropBuffer(LinkBuffer):
+    """
+    It drops the messages that arrive when the buffer is full.
+    """
+
+    def accept(self, link, queued, amount):
+        return True
+
+
+class REDBuffer(LinkBuffer):
+    """
+    Random Early Detection: the messages are dropped with a probability that increases with the average occupation of the queue, before the buffer is full.
+
+    Args:
+        capacity (int): the size of the buffer of each link
+
+        min_threshold (float): below this average occupation, no message is dropped
+
+        max_threshold (float): above this average occupation, all the messages are dropped
+
+    Kwargs:
+        max_p (float): the probability of dropping at *max_threshold*
+
+        weight (float): the weight of the current occupation in the average
+    """
+
+    def __init__(self, capacity, min_threshold, max_threshold, max_p=0.1, weight=0.002, **kwargs):
+        super(REDBuffer, self).__init__(capacity, **kwargs)
+        self.min_threshold = min_threshold
+        self.max_threshold = max_threshold
+        self.max_p = max_p
+        self.weight = weight
+        self.average = {}
+        # link -> average occupation of the queue
+
+    def accept(self, link, queued, amount):
+        avg = (1 - self.weight) * self.average.get(link, 0.0) + self.weight * queued
+        self.average[link] = avg
+        if avg < self.min_threshold:
+            return True
+        if avg >= self.max_threshold:
+            return False
+        p = self.max_p * (avg - self.min_threshold) / (self.max_threshold - self.min_threshold)
+        return random.random() >= p
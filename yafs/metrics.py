@@ -1,4 +1,292 @@
 import csv
+import json
+import math
+import queue
+import threading
+
+import numpy as np
+
+
+class ColumnarWriter:
+    """
+    It stores the records in memory and, every *chunk_size* records, it dumps them as a block of typed columns (numpy arrays) in a binary file.
+
+    The file contains the array of column names followed by the blocks. Each block is one *np.save* per column, in the same order of the names.
+    The type of each column is fixed by the schema, so all the blocks of a column have the same dtype:
+
+        TYPE_TEXT: dictionary-encoded, the array of distinct values followed by the integer codes of each record. None is written as "", as the csv module does.
+
+        TYPE_INT: int64. None is written as -1.
+
+        TYPE_FLOAT: float64. None is written as NaN, as pandas reads an empty csv field.
+
+    The schema is the expected type of each column. If a value does not fit it, i.e. a node identifier that is a string or a size that is a float, the column is written as float or as text from that block on, as the csv backend would read it.
+
+    It has the same *writerow* interface of a *csv.writer*.
+
+    Args:
+        file (file): a binary file opened to write
+
+        columns (list): the names of the columns
+
+        types (list): the type of each column
+
+    Kwargs:
+        chunk_size (int): number of records of each block
+    """
+
+    TYPE_TEXT = "text"
+    TYPE_INT = "int"
+    TYPE_FLOAT = "float"
+
+    def __init__(self, file, columns, types, chunk_size=100000):
+        if len(types) != len(columns):
+            raise ValueError("There must be a type for each column")
+        for type in types:
+            if type not in (self.TYPE_TEXT, self.TYPE_INT, self.TYPE_FLOAT):
+                raise ValueError("Unknown column type: %s" % type)
+        self.file = file
+        self.columns = columns
+        self.types = list(types)
+        self.chunk_size = chunk_size
+        self.rows = []
+        np.save(self.file, np.array(columns))
+
+    def writerow(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.chunk_size:
+            self.write_block()
+
+    def write_block(self):
+        self.writerows(self.rows)
+        self.rows = []
+
+    def writerows(self, rows):
+        """
+        Dumps the rows as one block
+        """
+        if not rows:
+            return
+        for i, values in enumerate(zip(*rows)):
+            type = self.types[i]
+            if type == self.TYPE_INT:
+                column = np.array([-1 if v is None else v for v in values])
+                if column.dtype.kind in "iub":
+                    column = column.astype(np.int64)
+                else:
+                    type = self.TYPE_FLOAT
+            if type == self.TYPE_FLOAT:
+                column = np.array([np.nan if v is None else v for v in values])
+                if column.dtype.kind in "fiub":
+                    column = column.astype(np.float64)
+                else:
+                    type = self.TYPE_TEXT
+            if type == self.TYPE_TEXT:
+                column = np.array(["" if v is None else str(v) for v in values], dtype=str)
+                categories, codes = np.unique(column, return_inverse=True)
+                np.save(self.file, categories, allow_pickle=False)
+                column = codes.astype(np.int32)
+            # A widened column keeps its new type in the next blocks
+            self.types[i] = type
+            np.save(self.file, column, allow_pickle=False)
+
+
+class BatchWriter:
+    """
+    It collects the rows of a writer and hands them over, in batches of *batch_size* rows, to the queue of the writer thread of :class:`Metrics`.
+    If the queue is full, *writerow* waits until the thread has written a batch.
+
+    Args:
+        writer (object): a *csv.writer* or a :class:`ColumnarWriter`
+
+        queue (queue.Queue): the bounded queue of the writer thread
+
+        batch_size (int): number of rows of each batch
+    """
+
+    def __init__(self, writer, queue, batch_size):
+        self.writer = writer
+        self.queue = queue
+        self.batch_size = batch_size
+        self.rows = []
+
+    def writerow(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.hand_over()
+
+    def hand_over(self):
+        if self.rows:
+            self.queue.put((self.writer, self.rows))
+            self.rows = []
+
+
+class RecordPolicy(object):
+    """
+    A record policy decides which records of :class:`Metrics` are written. The records are the dicts of *insert* and *insert_link*; its *type* key is one of the Sim metrics: COMP_M, SINK_M, LINK, ...
+
+    .. note:: A class interface
+    """
+
+    def accept(self, value):
+        """
+        Returns:
+            True if the record has to be written
+        """
+        return True
+
+    def close(self, path):
+        """
+        Invoked when the metrics are closed
+
+        Args:
+            path (str): path of the result files without extension
+        """
+
+
+class SamplingPolicy(RecordPolicy):
+    """
+    It accepts one of each *n* records of the same type
+
+    Args:
+        n (int): sampling period
+    """
+
+    def __init__(self, n):
+        self.n = n
+        self.counter = {}
+
+    def accept(self, value):
+        seen = self.counter.get(value["type"], 0)
+        self.counter[value["type"]] = seen + 1
+        return seen % self.n == 0
+
+
+class TypeFilterPolicy(RecordPolicy):
+    """
+    It only accepts the records of the given types
+
+    Args:
+        types (list): i.e. [Sim.SINK_METRIC, Sim.LINK_METRIC]
+    """
+
+    def __init__(self, types):
+        self.types = frozenset(types)
+
+    def accept(self, value):
+        return value["type"] in self.types
+
+
+class QuantileSketch(object):
+    """
+    A streaming histogram with logarithmic buckets: any quantile is estimated with a relative error lower than *alpha*, and the memory only depends on the range of the values.
+
+    Kwargs:
+        alpha (float): relative accuracy
+    """
+
+    def __init__(self, alpha=0.01):
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, value):
+        self.count += 1
+        if value <= 0:
+            self.zeros += 1
+        else:
+            key = int(math.ceil(math.log(value) / self.log_gamma))
+            self.buckets[key] = self.buckets.get(key, 0) + 1
+
+    def quantile(self, q):
+        if self.count == 0:
+            return float("nan")
+        rank = q * (self.count - 1)
+        accumulated = self.zeros
+        if rank < accumulated:
+            return 0.0
+        for key in sorted(self.buckets):
+            accumulated += self.buckets[key]
+            if accumulated > rank:
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+
+class AggregatePolicy(RecordPolicy):
+    """
+    It keeps in memory streaming counters and a :class:`QuantileSketch` of the response time for each (app, message) of the COMP_M and SINK_M records, and the usage of each link.
+    At the end, it writes a summary in *path*_summary.json (see :func:`yafs.stats.read_summary`).
+
+    Kwargs:
+        keep_records (boolean): False (aggregate-only), the records are not written
+
+        quantiles (list): the quantiles of the summary
+
+        alpha (float): relative accuracy of the quantiles
+    """
+
+    MESSAGE_TYPES = ("COMP_M", "SINK_M")
+    LINK_TYPE = "LINK"
+
+    def __init__(self, keep_records=False, quantiles=(0.5, 0.95, 0.99, 0.999), alpha=0.01):
+        self.keep_records = keep_records
+        self.quantiles = quantiles
+        self.alpha = alpha
+        self.messages = {}
+        self.links = {}
+        self.time = 0.0
+
+    def accept(self, value):
+        if value["type"] == self.LINK_TYPE:
+            key = (value["src"], value["dst"])
+            try:
+                link = self.links[key]
+            except KeyError:
+                link = self.links[key] = {"count": 0, "bytes": 0, "busy": 0.0}
+            link["count"] += 1
+            link["bytes"] += value["size"]
+            link["busy"] += value["latency"]
+            self.time = max(self.time, value["ctime"] + value["latency"])
+        elif value["type"] in self.MESSAGE_TYPES:
+            key = (value["app"], value["message"])
+            try:
+                msg = self.messages[key]
+            except KeyError:
+                msg = self.messages[key] = {"count": 0, "time_latency": 0.0, "time_wait": 0.0, "time_service": 0.0,
+                                            "time_total_response": 0.0, "max": 0.0, "sketch": QuantileSketch(self.alpha)}
+            response = value["time_out"] - value["time_emit"]
+            msg["count"] += 1
+            msg["time_latency"] += value["time_reception"] - value["time_emit"]
+            msg["time_wait"] += value["time_in"] - value["time_reception"]
+            msg["time_service"] += value["service"]
+            msg["time_total_response"] += response
+            msg["max"] = max(msg["max"], response)
+            msg["sketch"].add(response)
+            self.time = max(self.time, value["time_out"])
+        return self.keep_records
+
+    def summary(self):
+        messages = []
+        for (app, message), msg in self.messages.items():
+            row = {"app": app, "message": message, "count": msg["count"], "time_total_response_max": msg["max"]}
+            for column in ("time_latency", "time_wait", "time_service", "time_total_response"):
+                row[column + "_mean"] = msg[column] / msg["count"]
+            for q in self.quantiles:
+                row["p%s" % ("%g" % (q * 100))] = msg["sketch"].quantile(q)
+            messages.append(row)
+
+        links = []
+        for (src, dst), link in self.links.items():
+            links.append({"src": src, "dst": dst, "count": link["count"], "size": link["bytes"], "busy": link["busy"],
+                          "utilization": link["busy"] / self.time if self.time > 0 else 0.0})
+        return {"time": self.time, "messages": messages, "links": links}
+
+    def close(self, path):
+        with open("%s_summary.json" % path, "w") as f:
+            json.dump(self.summary(), f, default=str)
+
 
 class Metrics:
 
@@ -11,28 +299,119 @@ class Metrics:
     WATT_SERVICE = "byService"
     WATT_UPTIME = "byUptime"
 
+    FORMAT_CSV = "csv"
+    "One row of text for each record"
+
+    FORMAT_NPY = "npy"
+    "Blocks of typed columns, see :class:`ColumnarWriter`"
+
+    COLUMNS_EVENT = ["id","type", "app", "module", "message","DES.src","DES.dst","TOPO.src","TOPO.dst","module.src","service", "time_in","time_out",
+                     "time_emit","time_reception"]
+    COLUMNS_LINK = ["id","type", "src", "dst", "app", "latency", "message", "ctime", "size","buffer"]
+
+    TYPES_EVENT = [ColumnarWriter.TYPE_INT, ColumnarWriter.TYPE_TEXT, ColumnarWriter.TYPE_TEXT, ColumnarWriter.TYPE_TEXT,
+                   ColumnarWriter.TYPE_TEXT, ColumnarWriter.TYPE_FLOAT, ColumnarWriter.TYPE_FLOAT,
+                   ColumnarWriter.TYPE_FLOAT, ColumnarWriter.TYPE_FLOAT, ColumnarWriter.TYPE_TEXT,
+                   ColumnarWriter.TYPE_FLOAT, ColumnarWriter.TYPE_FLOAT, ColumnarWriter.TYPE_FLOAT,
+                   ColumnarWriter.TYPE_FLOAT, ColumnarWriter.TYPE_FLOAT]
+    # The DES and TOPO columns can be None (i.e. a message from a user), so they are floats as in a csv read by pandas
+    TYPES_LINK = [ColumnarWriter.TYPE_INT, ColumnarWriter.TYPE_TEXT, ColumnarWriter.TYPE_INT, ColumnarWriter.TYPE_INT,
+                  ColumnarWriter.TYPE_TEXT, ColumnarWriter.TYPE_FLOAT, ColumnarWriter.TYPE_TEXT,
+                  ColumnarWriter.TYPE_FLOAT, ColumnarWriter.TYPE_INT, ColumnarWriter.TYPE_INT]
+
+    def __init__(self, default_results_path=None, format=FORMAT_CSV, chunk_size=100000, threaded=False, max_pending_records=1000000, policies=None):
+        """
+        Kwargs:
+            default_results_path (str): path of the files without extension. By default: result
 
-    def __init__(self, default_results_path=None):
-        columns_event = ["id","type", "app", "module", "message","DES.src","DES.dst","TOPO.src","TOPO.dst","module.src","service", "time_in","time_out",
-                         "time_emit","time_reception"]
-        columns_link = ["id","type", "src", "dst", "app", "latency", "message", "ctime", "size","buffer"]
+            format (str): FORMAT_CSV or FORMAT_NPY
 
+            chunk_size (int): number of records of each npy block, and of each batch handed over to the writer thread
+
+            threaded (boolean): the files are written by a background thread instead of the simulation one
+
+            max_pending_records (int): with *threaded*, the maximum number of records waiting in memory to be written. The simulation waits when it is reached.
+
+            policies (list): a list of :class:`RecordPolicy`. A record is written if all of them accept it; they are evaluated in order until one rejects it, so an :class:`AggregatePolicy` has to be the first one to see every record.
+        """
         path = "result"
         if  default_results_path is not None:
             path = default_results_path
 
-        self.__filef = open("%s.csv" % path, "w")
-        self.__filel = open("%s_link.csv"%path, "w")
-        self.__ff = csv.writer(self.__filef)
-        self.__ff_link = csv.writer(self.__filel)
-        self.__ff.writerow(columns_event)
-        self.__ff_link.writerow(columns_link)
+        self.path = path
+        self.policies = policies or []
+
+        self.format = format
+        if format == self.FORMAT_CSV:
+            self.__filef = open("%s.csv" % path, "w")
+            self.__filel = open("%s_link.csv"%path, "w")
+            self.__ff = csv.writer(self.__filef)
+            self.__ff_link = csv.writer(self.__filel)
+            self.__ff.writerow(self.COLUMNS_EVENT)
+            self.__ff_link.writerow(self.COLUMNS_LINK)
+        elif format == self.FORMAT_NPY:
+            self.__filef = open("%s.npy" % path, "wb")
+            self.__filel = open("%s_link.npy" % path, "wb")
+            self.__ff = ColumnarWriter(self.__filef, self.COLUMNS_EVENT, self.TYPES_EVENT, chunk_size)
+            self.__ff_link = ColumnarWriter(self.__filel, self.COLUMNS_LINK, self.TYPES_LINK, chunk_size)
+        else:
+            raise ValueError("Unknown metrics format: %s" % format)
+
+        self.__writer_thread = None
+        if threaded:
+            self.__queue = queue.Queue(maxsize=max(1, max_pending_records // chunk_size))
+            self.__writer_error = None
+            self.__ff = BatchWriter(self.__ff, self.__queue, chunk_size)
+            self.__ff_link = BatchWriter(self.__ff_link, self.__queue, chunk_size)
+            self.__writer_thread = threading.Thread(target=self.__write_batches, name="metrics-writer", daemon=True)
+            self.__writer_thread.start()
+
+    def __write_batches(self):
+        """
+        Body of the writer thread. A *None* item stops it.
+        """
+        while True:
+            item = self.__queue.get()
+            try:
+                if item is None:
+                    return
+                if self.__writer_error is None:
+                    writer, rows = item
+                    writer.writerows(rows)
+            except Exception as e:
+                # The batches are consumed anyway, the simulation can not wait for ever
+                self.__writer_error = e
+            finally:
+                self.__queue.task_done()
+
+    def __drain(self):
+        """
+        Waits until the writer thread has written all the batches
+        """
+        self.__ff.hand_over()
+        self.__ff_link.hand_over()
+        self.__queue.join()
+        if self.__writer_error is not None:
+            raise self.__writer_error
 
     def flush(self):
+        if self.__writer_thread is not None:
+            self.__drain()
+        elif self.format == self.FORMAT_NPY:
+            self.__ff.write_block()
+            self.__ff_link.write_block()
         self.__filef.flush()
         self.__filel.flush()
 
+    def __accept(self, value):
+        for policy in self.policies:
+            if not policy.accept(value):
+                return False
+        return True
+
     def insert(self,value):
+        if self.policies and not self.__accept(value):
+            return
 
         self.__ff.writerow([value["id"],value["type"],
                     value["app"],
@@ -51,6 +430,9 @@ class Metrics:
                             ])
 
     def insert_link(self, value):
+        if self.policies and not self.__accept(value):
+            return
+
         self.__ff_link.writerow([value["id"],value["type"],
                     value["src"],
                     value["dst"],
@@ -64,5 +446,17 @@ class Metrics:
                             ])
 
     def close(self):
+        if self.__writer_thread is not None:
+            try:
+                self.__drain()
+            finally:
+                self.__queue.put(None)
+                self.__writer_thread.join()
+                self.__writer_thread = None
+        elif self.format == self.FORMAT_NPY:
+            self.__ff.write_block()
+            self.__ff_link.write_block()
         self.__filef.close()
         self.__filel.close()
+        for policy in self.policies:
+            policy.close(self.path)
@@ -1,34 +1,34 @@
 from yafs.selection import Selection
+from yafs.balancing import RoundRobinBalancer
 import networkx as nx
-from collections import Counter
 
 class DeviceSpeedAwareRouting(Selection):
+    """
+    It chooses the nearest replica of the destination module. The *balancer* chooses among the replicas at the same distance.
 
-    def __init__(self):
-        self.cache = {}
-        self.counter = Counter(list())
-        self.invalid_cache_value = True
+    Kwargs:
+        balancer (:mod:`Balancer`): round robin by default
+    """
 
-        self.controlServices = {}
-        # key: a service
-        # value : a list of idDevices
+    def __init__(self, balancer=None):
+        self.balancer = balancer or RoundRobinBalancer()
         super(DeviceSpeedAwareRouting, self).__init__()
 
-    def compute_BEST_DES(self, node_src, alloc_DES, sim, DES_dst,message):
+    def compute_BEST_DES(self, node_src, alloc_DES, sim, DES_dst,message,app_name=None):
         try:
             bestLong = float('inf')
             minPath = []
             bestDES = []
             moreDES = []
             #print len(DES_dst)
+            routing = sim.topology.get_routing_table()
             for dev in DES_dst:
                 node_dst = alloc_DES[dev]
-                path = list(nx.shortest_path(sim.topology.G, source=node_src, target=node_dst))
-                long = len(path)
+                long = routing.get_distance(node_src, node_dst) + 1 # number of nodes of the path
 
                 if long < bestLong:
                     bestLong = long
-                    minPath = path
+                    minPath = routing.get_path(node_src, node_dst)
                     bestDES = dev
                     moreDES = []
                 elif long == bestLong:
@@ -38,19 +38,11 @@ class DeviceSpeedAwareRouting(Selection):
                     moreDES.append(dev)
 
 
-            # There are two or more options in a node: #ROUND ROBIN Schedule
+            # There are two or more options at the same distance
             if len(moreDES)>0:
-                ### RETURN
-                bestValue = 0
-                minCounter =  float('inf')
-                for idx,service in enumerate(moreDES):
-                    if not service in self.counter:
-                        return minPath, service
-                    else:
-                        if minCounter < self.counter[service]:
-                            minCounter = self.counter
-                            bestValue = idx
-                return minPath, moreDES[bestValue]
+                bestDES = self.balancer.choose(sim, app_name or message.app_name, message.dst, moreDES)
+                # The chosen one can be deployed in another node at the same distance
+                return routing.get_path(node_src, alloc_DES[bestDES]), bestDES
             else:
                 return minPath, bestDES
 
@@ -61,55 +53,46 @@ class DeviceSpeedAwareRouting(Selection):
 
     def get_path(self, sim, app_name, message, topology_src, alloc_DES, alloc_module, traffic, from_des):
         node_src = topology_src #entity that sends the message
-        service = message.dst         # Name of the service
         DES_dst = alloc_module[app_name][message.dst] #module sw that can serve the message
 
-        #The number of nodes control the updating of the cache. If the number of nodes changes, the cache is totally cleaned.
-        path, des = self.compute_BEST_DES(node_src, alloc_DES, sim, DES_dst,message)
+        path, des = self.compute_BEST_DES(node_src, alloc_DES, sim, DES_dst,message,app_name)
 
-        try:
-            dc = int(des)
-            self.counter[dc] += 1
-            self.controlServices[(node_src, service)] = (path, des)
-        except TypeError: # The node is not linked with other nodes
+        if des is None or des == []: # There are no replicas or the node is not linked with other nodes
             return [], None
 
         return [path], [des]
 
     def clear_routing_cache(self):
-        self.invalid_cache_value = False
-        self.cache = {}
-        self.counter = Counter(list())
-        self.controlServices = {}
+        self.balancer.clear()
 
     def get_path_from_failure(self, sim, message, link, alloc_DES, alloc_module, traffic, ctime, from_des):
 
-        idx = message.path.index(link[0])
-        #print "IDX: ",idx
-        if idx == len(message.path):
-            # The node who serves ... not possible case
-            return [],[]
-        else:
-            node_src = message.path[idx] #In this point to the other entity the system fail
-            # print "SRC: ",node_src # 164
-
-            node_dst = message.path[len(message.path)-1]
-            # print "DST: ",node_dst #261
-            # print "INT: ",message.dst_int #301
-
+        # The hop cursor points to the unreachable entity: link[1]
+        idx = message.hop - 1
+        node_src = message.path[idx] #In this point to the other entity the system fail
+        # print "SRC: ",node_src # 164
+
+        # The message keeps its destination if it is still reachable: the detour comes from the tree of that node, shared by all the messages towards it
+        path, des = [], []
+        if message.idDES in alloc_DES:
+            try:
+                path = [sim.topology.get_routing_table().get_path_towards(node_src, alloc_DES[message.idDES])]
+                des = [message.idDES]
+            except (nx.NetworkXNoPath, nx.NodeNotFound):
+                path = []
+        if not path:
+            # Otherwise, another replica is chosen
             path, des = self.get_path(sim,message.app_name,message,node_src,alloc_DES,alloc_module,traffic,from_des)
-            if len(path[0])>0:
-                # print path # [[164, 130, 380, 110, 216]]
-                # print des # [40]
-
-                concPath = message.path[0:message.path.index(path[0][0])] + path[0]
-                # print concPath # [86, 242, 160, 164, 130, 380, 110, 216]
-                newINT = node_src #path[0][2]
-                # print newINT # 380
-
-                message.dst_int = newINT
-                return [concPath], des
-            else:
-                return [],[]
 
+        if path and len(path[0])>0:
+            # print path # [[164, 130, 380, 110, 216]]
+            # print des # [40]
 
+            # The new route starts in node_src, so the cursor is rewritten to its position
+            concPath = message.path[0:idx] + path[0]
+            # print concPath # [86, 242, 160, 164, 130, 380, 110, 216]
+            message.hop = idx
+            message.dst_int = node_src
+            return [concPath], des
+        else:
+            return [],[]
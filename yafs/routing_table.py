@@ -0,0 +1,226 @@
+"""
+    A routing table shares the shortest paths of the topology among the selection algorithms.
+
+    The shortest path tree of each source is computed the first time that it is required, and it is reused until the topology changes.
+    When a node or a link is removed or added, only the trees affected by that change are discarded.
+"""
+import heapq
+import itertools
+
+import networkx as nx
+
+
+class RoutingTable(object):
+    """
+    Shortest path trees by source, by hops or by a weight of the links.
+
+    Args:
+        G (*networkx.classes.graph.Graph*): the graph of the topology
+
+    A weight is None (number of hops), the name of a link attribute, or a function *f(src, dst, attributes)*. The function object is part of the key of the cache, so the same one has to be reused.
+    """
+
+    def __init__(self, G):
+        self.G = G
+        self.trees = {}
+        # (source, weight) -> (distance, parent, internal)
+        # distance: node -> distance from the source
+        # parent: node -> previous node in the path from the source
+        # internal: set of nodes that are the parent of other ones
+
+    def clear(self):
+        self.trees = {}
+
+    def __weight_function(self, weight):
+        if weight is None:
+            return lambda src, dst, att: 1
+        if callable(weight):
+            return weight
+        return lambda src, dst, att: att[weight]
+
+    def __compute_tree(self, source, weight):
+        if source not in self.G:
+            raise nx.NodeNotFound("Source %s is not in G" % source)
+        adj = self.G.adj
+        distance = {source: 0}
+        parent = {source: None}
+
+        if weight is None:
+            # BFS
+            frontier = [source]
+            while frontier:
+                next_frontier = []
+                for u in frontier:
+                    du = distance[u] + 1
+                    for v in adj[u]:
+                        if v not in distance:
+                            distance[v] = du
+                            parent[v] = u
+                            next_frontier.append(v)
+                frontier = next_frontier
+        else:
+            # Dijkstra
+            w = self.__weight_function(weight)
+            counter = itertools.count()
+            done = set()
+            heap = [(0, next(counter), source)]
+            while heap:
+                du, _, u = heapq.heappop(heap)
+                if u in done:
+                    continue
+                done.add(u)
+                for v, att in adj[u].items():
+                    dv = du + w(u, v, att)
+                    if v not in distance or dv < distance[v]:
+                        distance[v] = dv
+                        parent[v] = u
+                        heapq.heappush(heap, (dv, next(counter), v))
+
+        internal = set(parent.values())
+        internal.discard(None)
+        return distance, parent, internal
+
+    def __get_tree(self, source, weight):
+        try:
+            return self.trees[source, weight]
+        except KeyError:
+            tree = self.trees[source, weight] = self.__compute_tree(source, weight)
+            return tree
+
+    def get_distances(self, source, weight=None):
+        """
+        Returns:
+            a dict with the distance from the source to each reachable node
+
+        Raises:
+            networkx.NodeNotFound: the source is not in the topology
+        """
+        return self.__get_tree(source, weight)[0]
+
+    def get_distance(self, source, target, weight=None):
+        """
+        Raises:
+            networkx.NetworkXNoPath: the target is not reachable from the source
+        """
+        try:
+            return self.__get_tree(source, weight)[0][target]
+        except KeyError:
+            raise nx.NetworkXNoPath("No path between %s and %s." % (source, target))
+
+    def get_path(self, source, target, weight=None):
+        """
+        Returns:
+            a list of nodes, from the source to the target
+
+        Raises:
+            networkx.NodeNotFound: the source is not in the topology
+
+            networkx.NetworkXNoPath: the target is not reachable from the source
+        """
+        parent = self.__get_tree(source, weight)[1]
+        if target not in parent:
+            raise nx.NetworkXNoPath("No path between %s and %s." % (source, target))
+        path = [target]
+        node = parent[target]
+        while node is not None:
+            path.append(node)
+            node = parent[node]
+        path.reverse()
+        return path
+
+    def get_path_towards(self, node, target, weight=None):
+        """
+        Returns the shortest path from a node to the target using the tree of the target: links are bidirectional, so the parent of each node is its next hop towards the target.
+        All the nodes that are rerouted to the same target share that tree, so the messages of a failure are rerouted in O(length of the path).
+
+        Returns:
+            a list of nodes, from the node to the target
+
+        Raises:
+            networkx.NodeNotFound: the target is not in the topology
+
+            networkx.NetworkXNoPath: the target is not reachable from the node
+        """
+        parent = self.__get_tree(target, weight)[1]
+        if node not in parent:
+            raise nx.NetworkXNoPath("No path between %s and %s." % (node, target))
+        path = [node]
+        node = parent[node]
+        while node is not None:
+            path.append(node)
+            node = parent[node]
+        return path
+
+    def remove_node(self, node):
+        """
+        Updates the trees once the node has been removed from G. A tree is only discarded if some path of it goes through the node.
+        """
+        for key in list(self.trees):
+            source, weight = key
+            distance, parent, internal = self.trees[key]
+            if source == node or node in internal:
+                del self.trees[key]
+            elif node in parent:
+                # The node is a leaf of the tree
+                del parent[node]
+                del distance[node]
+
+    def add_node(self, node):
+        """
+        Updates the trees once the node and its links have been added to G. A tree is only discarded if the node is a shortcut among its nodes or it joins unreachable ones.
+        """
+        links = self.G.adj[node]
+        for key in list(self.trees):
+            source, weight = key
+            distance, parent, internal = self.trees[key]
+            w = self.__weight_function(weight)
+
+            try:
+                reachable = [(distance[v] + w(v, node, att), v) for v, att in links.items() if v in distance]
+                if not reachable:
+                    continue
+                d_node, previous = min(reachable, key=lambda item: item[0])
+
+                shortcut = False
+                for v, att in links.items():
+                    if v not in distance or d_node + w(node, v, att) < distance[v]:
+                        shortcut = True
+                        break
+            except KeyError:
+                # The new links have not the attribute of the weight
+                shortcut = True
+
+            if shortcut:
+                del self.trees[key]
+            else:
+                distance[node] = d_node
+                parent[node] = previous
+                internal.add(previous)
+
+    def remove_edge(self, src, dst):
+        """
+        Updates the trees once the link has been removed from G. A tree is only discarded if the link is one of its branches.
+        """
+        for key in list(self.trees):
+            parent = self.trees[key][1]
+            if parent.get(dst, None) == src or parent.get(src, None) == dst:
+                del self.trees[key]
+
+    def add_edge(self, src, dst):
+        """
+        Updates the trees once the link has been added to G. A tree is only discarded if the link is a shortcut.
+        """
+        att = self.G.adj[src][dst]
+        for key in list(self.trees):
+            source, weight = key
+            distance = self.trees[key][0]
+            if src not in distance and dst not in distance:
+                continue
+            try:
+                w = self.__weight_function(weight)(src, dst, att)
+            except KeyError:
+                del self.trees[key]
+                continue
+            if src not in distance or dst not in distance \
+                    or distance[src] + w < distance[dst] or distance[dst] + w < distance[src]:
+                del self.trees[key]
@@ -5,11 +5,15 @@
 
 
 """
+import itertools
 import random
 import logging
+from collections import OrderedDict
 
 import networkx as nx
 
+from yafs.topology import Topology
+
 
 class Selection(object):
     """
@@ -38,7 +42,7 @@ class Selection(object):
         :param ctime:
         :param from_des
         :return:
-           both empty arrays implies that the message will not send to the destination.
+           both empty arrays implies that the message will not send to the destination. The built-in algorithms return [], [None] when no replica is reachable, so the simulator warns about it.
 
         Returns:
 
@@ -60,6 +64,7 @@ class Selection(object):
     def get_path_from_failure(self, sim, message, link, alloc_DES, alloc_module, traffic, ctime, from_des):
         """
         This function is call when some link of a message path is broken or unavailable. A new one from that point should be calculated.
+        The *message.hop* cursor points to the unreachable entity (link[1]); the new path must set it to the position of the entity where the message restarts.
 
         :param sim:
         :param message:
@@ -81,48 +86,240 @@ class Selection(object):
         """ END Selection """
         return path, ids
 
+class CachedSelection(object):
+    """
+    A mixin that reuses the routing decisions of a selection algorithm. The messages that are sent from the same node to the same service, with a similar size, follow the same route.
+
+    The decisions are kept until the allocation of modules or the topology change (see *Sim.version*), and the least recently used ones are discarded beyond *cache_size*.
+    It has to precede the selection algorithm in the bases of the class:
+
+    .. code-block:: python
+
+        class CachedRouting(CachedSelection, DeviceSpeedAwareRouting):
+            pass
+
+    .. attention:: the decisions of selections that depend on the load (balancers, *LoadAwareRouting*) are frozen by the cache
+
+    Kwargs:
+        cache_size (int): maximum number of decisions
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.cache_size = kwargs.pop("cache_size", 10000)
+        super(CachedSelection, self).__init__(*args, **kwargs)
+        self.decisions = OrderedDict()
+        # (node_src, app_name, service, size class) -> (paths, DES)
+        self.decisions_version = 0
+        self.hits = 0
+        self.misses = 0
+
+    def size_class(self, size):
+        """
+        Returns:
+            the class of a message size in the key of the cache: its power of two by default
+        """
+        return int(size).bit_length()
+
+    def clear_decisions(self):
+        self.decisions = OrderedDict()
+
+    def get_path(self, sim, app_name, message, topology_src, alloc_DES, alloc_module, traffic, from_des):
+        if self.decisions_version != sim.version:
+            self.clear_decisions()
+            self.decisions_version = sim.version
+
+        key = (topology_src, app_name, message.dst, self.size_class(message.bytes))
+        try:
+            decision = self.decisions[key]
+            self.decisions.move_to_end(key)
+            self.hits += 1
+            return decision
+        except KeyError:
+            self.misses += 1
+
+        paths, DES_dst = super(CachedSelection, self).get_path(sim, app_name, message, topology_src, alloc_DES, alloc_module, traffic, from_des)
+        if paths and None not in DES_dst:
+            self.decisions[key] = (paths, DES_dst)
+            if len(self.decisions) > self.cache_size:
+                self.decisions.popitem(last=False)
+        return paths, DES_dst
+
+
+class LoadAwareRouting(Selection):
+    """
+    Among all the replicas of the destination module, it returns the one with the earliest expected completion time.
+
+    The expected time of each replica combines:
+
+        the transmission of the message through the path, waiting in each link until the end of its last transfer (*traffic*);
+
+        the messages that are waiting in the pipe of the replica;
+
+        the service time of the message in the node of the replica: *inst/IPT*.
+
+    The paths are the fastest ones for the size of the message and they are cached until the allocation of modules or the topology change.
+    Each cached route keeps the earliest time at which a message could leave its last link due to the transfers already scheduled in its links. The simulation updates it when the occupancy of a link changes (see *Sim.link_listeners*), so each decision is O(replicas).
+    """
+
+    def __init__(self, logger=None):
+        super(LoadAwareRouting, self).__init__(logger)
+        self.routes = {}
+        # (node_src, node_dst, size) -> [path, latency of the path, ready time]
+        self.routes_by_link = {}
+        # link -> [(route, latency from the link to the end of the path), ...]
+        self.link_weights = {}
+        # message size -> weight function of the links
+        self.version = 0
+        self.sim = None
+        # the simulation whose link updates are listened
+
+    def __link_weight(self, size):
+        if size not in self.link_weights:
+            self.link_weights[size] = lambda src, dst, att: att[Topology.LINK_PR] + size / att[Topology.LINK_BW]
+        return self.link_weights[size]
+
+    def __get_route(self, sim, node_src, node_dst, size, traffic):
+        key = (node_src, node_dst, size)
+        try:
+            return self.routes[key]
+        except KeyError:
+            path = sim.topology.get_routing_table().get_path(node_src, node_dst, self.__link_weight(size))
+            links = [(path[i], path[i + 1]) for i in range(len(path) - 1)]
+            latencies = [sim.topology.get_link_latency(link, size) for link in links]
+            route = self.routes[key] = [path, sum(latencies), 0.0]
+            remaining = route[1]
+            for link, latency in zip(links, latencies):
+                self.routes_by_link.setdefault(link, []).append((route, remaining))
+                route[2] = max(route[2], traffic.get(link, 0.0) + remaining)
+                remaining -= latency
+            return route
+
+    def update_link(self, link, busy_time):
+        """
+        The link is busy until *busy_time*: the ready time of the routes through it is updated
+        """
+        for route, remaining in self.routes_by_link.get(link, ()):
+            if busy_time + remaining > route[2]:
+                route[2] = busy_time + remaining
+
+    def get_path(self, sim, app_name, message, topology_src, alloc_DES, alloc_module, traffic, from_des):
+        if self.sim is not sim:
+            sim.link_listeners.append(self.update_link)
+            self.sim = sim
+        if self.version != sim.version:
+            self.routes = {}
+            self.routes_by_link = {}
+            self.version = sim.version
+
+        now = sim.env.now
+        att_node = sim.topology.get_nodes_att()
+        bestTime = float('inf')
+        bestPath = []
+        bestDES = [None]
+        for des in alloc_module[app_name][message.dst]:
+            node_dst = alloc_DES[des]
+            try:
+                path, latency, ready = self.__get_route(sim, topology_src, node_dst, message.bytes, traffic)
+            except (nx.NetworkXNoPath, nx.NodeNotFound):
+                continue
+
+            # Each link transmits the message after the end of its last transfer
+            arrival = max(now + latency, ready)
+
+            service = message.inst / float(att_node[node_dst]["IPT"])
+            backlog = sim.get_consumer_backlog(app_name, message.dst, des)
+            completion = max(arrival, now + backlog * service) + service
+
+            if completion < bestTime:
+                bestTime = completion
+                bestPath = [path]
+                bestDES = [des]
+
+        return bestPath, bestDES
+
+    def get_path_from_failure(self, sim, message, link, alloc_DES, alloc_module, traffic, ctime, from_des):
+        # The hop cursor points to the unreachable entity: link[1]
+        idx = message.hop - 1
+        node_src = message.path[idx]
+        path, des = self.get_path(sim, message.app_name, message, node_src, alloc_DES, alloc_module, traffic, from_des)
+        if path:
+            message.hop = idx
+            message.dst_int = node_src
+            return [message.path[0:idx] + path[0]], des
+        return [], [None]
+
+
 class OneRandomPath(Selection):
     """
-    Among all the possible options, it returns a random path.
+    Among all the possible options, it returns a random path to each replica of the destination module.
+
+    The options of each pair of nodes are the *k* shortest simple paths (Yen's algorithm). They are computed once and reused until the allocation of modules or the topology change.
+
+    Args:
+        k (int): maximum number of paths among which one is chosen
     """
 
+    def __init__(self, k=10, logger=None):
+        super(OneRandomPath, self).__init__(logger)
+        self.k = k
+        self.paths = {}
+        # (src_node, dst_node) -> list of the k shortest paths
+        self.version = 0
+
+    def __get_paths(self, sim, src_node, dst_node):
+        try:
+            return self.paths[src_node, dst_node]
+        except KeyError:
+            try:
+                paths = list(itertools.islice(nx.shortest_simple_paths(sim.topology.G, src_node, dst_node), self.k))
+            except (nx.NetworkXNoPath, nx.NodeNotFound):
+                paths = []
+            self.paths[src_node, dst_node] = paths
+            return paths
+
     def get_path(self, sim, app_name, message, topology_src,alloc_DES, alloc_module, traffic,from_des):
+        if self.version != sim.version:
+            self.paths = {}
+            self.version = sim.version
+
         paths = []
         dst_idDES = []
         src_node = topology_src
-        DES = alloc_module[message.app_name][message.dst]
+        DES = alloc_module[app_name][message.dst]
         for idDES in DES:
-            dst_node = alloc_module[idDES]
-            pathX = list(nx.all_simple_paths(sim.topology.G, source=src_node, target=dst_node))
-            one = random.randint(0, len(pathX) - 1)
-            paths.append(pathX[one])
-            dst_idDES.append(idDES)
+            dst_node = alloc_DES[idDES]
+            pathX = self.__get_paths(sim, src_node, dst_node)
+            if pathX:
+                paths.append(random.choice(pathX))
+                dst_idDES.append(idDES)
+        if not paths:
+            return [], [None]
         return paths,dst_idDES
 
 
 
 class First_ShortestPath(Selection):
-    """Among all possible shorter paths, returns the first."""
+    """Among all the replicas of the destination module, returns the nearest one (number of hops) and its shortest path."""
 
     def get_path(self, sim, app_name,message, topology_src, alloc_DES, alloc_module, traffic,from_des):
-        paths = []
-        dst_idDES = []
-
         node_src = topology_src #TOPOLOGY SOURCE where the message is generated
         DES_dst = alloc_module[app_name][message.dst]
 
-        #Among all possible path we choose the smallest
-        bestPath = []
-        bestDES = []
-        print (DES_dst)
-        for des in DES_dst:
-            dst_node = alloc_DES[des]
-            # print "DES Node %i " %dst_node
-
-            path = list(nx.shortest_path(sim.topology.G, source=node_src, target=dst_node))
-            bestPath = [path]
-            bestDES  = [des]
-            print (path)
+        # The BFS distances from the source are cached by the routing table of the topology
+        routing = sim.topology.get_routing_table()
+        try:
+            distance = routing.get_distances(node_src)
+        except nx.NodeNotFound:
+            return [], [None]
 
-
-        return bestPath,bestDES
+        bestDistance = float('inf')
+        bestDES = None
+        for des in DES_dst:
+            d = distance.get(alloc_DES[des], bestDistance)
+            if d < bestDistance:
+                bestDistance = d
+                bestDES = des
+
+        if bestDES is None:
+            return [], [None]
+        return [routing.get_path(node_src, alloc_DES[bestDES])], [bestDES]
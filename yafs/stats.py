@@ -1,14 +1,183 @@
+import json
+import os
+
 import pandas as pd
 import numpy as np
 
 from yafs.metrics import Metrics
 
 
-class Stats:
+def _skip_array(f):
+    """
+    Moves the file after the next array without reading its data
+    """
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+    f.seek(int(np.prod(shape)) * dtype.itemsize, os.SEEK_CUR)
+    return dtype
+
+
+def iter_columnar(path, columns=None):
+    """
+    Reads, block by block, a file written by :class:`yafs.metrics.ColumnarWriter`
+
+    Args:
+        path (str): the file
+
+    Kwargs:
+        columns (list): the columns to read, the data of the other ones is skipped. By default, all of them
+
+    Returns:
+        a generator of *pandas.DataFrame*, one for each block
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        names = [str(c) for c in np.load(f)]
+        if columns is None:
+            columns = names
+        while f.tell() < size:
+            data = {}
+            for name in names:
+                if name in columns:
+                    column = np.load(f)
+                    if column.dtype.kind == "U":  # dictionary-encoded text
+                        column = column.astype(object)[np.load(f)]
+                    data[name] = column
+                elif _skip_array(f).kind == "U":
+                    _skip_array(f)
+            yield pd.DataFrame(data, columns=columns)
+
+
+def read_columnar(path):
+    """
+    Reads a file written by :class:`yafs.metrics.ColumnarWriter`
+
+    Args:
+        path (str): the file
+
+    Returns:
+        a *pandas.DataFrame* with one column for each name of the file
+    """
+    with open(path, "rb") as f:
+        columns = [str(c) for c in np.load(f)]
+    blocks = list(iter_columnar(path))
+    if not blocks:
+        return pd.DataFrame(columns=columns)
+
+    data = {}
+    for name in columns:
+        try:
+            data[name] = np.concatenate([block[name].values for block in blocks])
+        except TypeError:  # blocks with different types
+            data[name] = np.concatenate([block[name].values.astype(object) for block in blocks])
+    return pd.DataFrame(data, columns=columns)
+
+
+def compute_times(df):
+    """
+    Adds to a dataframe of node records the columns of the times: latency, wait, service, response and total response
+    """
+    df["time_latency"] = df["time_reception"] - df["time_emit"]
+    df["time_wait"] = df["time_in"] - df["time_reception"]  #
+    df["time_service"] = df["time_out"] - df["time_in"]
+    df["time_response"] = df["time_out"] - df["time_reception"]
+    df["time_total_response"] = df["time_response"] + df["time_latency"]
+
+
+def read_summary(path):
+    """
+    Reads the summary written by :class:`yafs.metrics.AggregatePolicy`
+
+    Args:
+        path (str): path of the result files without extension
+
+    Returns:
+        two *pandas.DataFrame*: one row by (app, message) and one row by link
+    """
+    with open(path + "_summary.json") as f:
+        data = json.load(f)
+    return pd.DataFrame(data["messages"]), pd.DataFrame(data["links"])
+
+
+def read_deadlines(data):
+    """
+    Args:
+        data (list): the applications of an appDefinition.json
+
+    Returns:
+        a dict: app name -> deadline
+    """
+    return {str(app["name"]): app["deadline"] for app in data if "deadline" in app}
+
 
-    def __init__(self,defaultPath="result"):
-        self.df_link = pd.read_csv(defaultPath + "_link.csv")
-        self.df = pd.read_csv(defaultPath + ".csv")
+class Stats:
+    """
+    The reports are answered from aggregates by message, DES, node and (module, DES) that are computed once, in one pass over the dataframe, and cached.
+    """
+
+    TIMES = ["time_latency", "time_wait", "time_service", "time_response", "time_total_response"]
+    AGGREGATIONS = {"sum": "sum", "count": "sum", "min": "min", "max": "max"}
+    # how each aggregation of a chunk is combined with the previous ones
+    REQUEST_TYPES = ("COMP_M", "SINK_M")
+    # the records of the modules that compose a request: Sim.NODE_METRIC and Sim.SINK_METRIC
+    COLUMNS_REQUEST = ["loop", "app", "id", "start", "end", "latency"]
+
+    def __init__(self,defaultPath="result",format=Metrics.FORMAT_CSV):
+        if format == Metrics.FORMAT_NPY:
+            self.df_link = read_columnar(defaultPath + "_link.npy")
+            self.df = read_columnar(defaultPath + ".npy")
+        else:
+            self.df_link = pd.read_csv(defaultPath + "_link.csv")
+            self.df = pd.read_csv(defaultPath + ".csv")
+
+        self._by_message = None
+        # message -> (time, sum|count|min|max) of each column in TIMES
+        self._by_des = None
+        # DES.dst -> time_service
+        self._by_node = None
+        # TOPO.dst -> time_service
+        self._by_module = None
+        # (module, DES.dst) -> sum and count of service
+        self._aggregated = False
+
+    @staticmethod
+    def _merge(acc, part, how):
+        if acc is None:
+            return part
+        return pd.concat([acc, part]).groupby(level=list(range(part.index.nlevels))).agg(how)
+
+    def _add_events(self, chunk):
+        """
+        Adds a dataframe of node records to the aggregates
+        """
+        if len(chunk) == 0:
+            return
+        if "time_response" not in chunk.columns:
+            compute_times(chunk)
+
+        part = chunk.groupby("message")[self.TIMES].agg(list(self.AGGREGATIONS))
+        how = {column: self.AGGREGATIONS[column[1]] for column in part.columns}
+        self._by_message = self._merge(self._by_message, part, how)
+
+        self._by_des = self._merge(self._by_des, chunk.groupby("DES.dst").time_service.sum(), "sum")
+        self._by_node = self._merge(self._by_node, chunk.groupby("TOPO.dst").time_service.sum(), "sum")
+        part = chunk.groupby(["module", "DES.dst"]).service.agg(["sum", "count"])
+        self._by_module = self._merge(self._by_module, part, "sum")
+
+    def _aggregate(self):
+        if not self._aggregated:
+            self._add_events(self.df)
+            self._aggregated = True
+        if self._by_message is None:  # there are no records: the aggregates are empty
+            columns = pd.MultiIndex.from_product([self.TIMES, list(self.AGGREGATIONS)])
+            self._by_message = pd.DataFrame(columns=columns, index=pd.Index([], name="message"), dtype=np.float64)
+            self._by_des = pd.Series(index=pd.Index([], name="DES.dst"), name="time_service", dtype=np.float64)
+            self._by_node = pd.Series(index=pd.Index([], name="TOPO.dst"), name="time_service", dtype=np.float64)
+            index = pd.MultiIndex.from_arrays([[], []], names=["module", "DES.dst"])
+            self._by_module = pd.DataFrame(columns=["sum", "count"], index=index, dtype=np.float64)
 
 
     def bytes_transmitted(self):
@@ -19,60 +188,109 @@ class Stats:
 
 
     def utilization(self,id_entity, total_time, from_time=0.0):
-        if "time_service" not in self.df.columns: #cached
-            self.df["time_service"] = self.df.time_out - self.df.time_in
-        values = self.df.groupby("DES.dst").time_service.agg("sum")
-        return values[id_entity] / total_time
+        self._aggregate()
+        return self._by_des[id_entity] / total_time
 
     def compute_times_df(self):
-        self.df["time_latency"] = self.df["time_reception"] - self.df["time_emit"]
-        self.df["time_wait"] = self.df["time_in"] - self.df["time_reception"]  #
-        self.df["time_service"] = self.df["time_out"] - self.df["time_in"]
-        self.df["time_response"] = self.df["time_out"] - self.df["time_reception"]
-        self.df["time_total_response"] = self.df["time_response"] + self.df["time_latency"]
+        compute_times(self.df)
 
     def times(self,time,value="mean"):
-        if "time_response" not in self.df.columns:
-            self.compute_times_df()
-        return self.df.groupby("message").agg({time:value})
-
+        if value not in ("mean",) + tuple(self.AGGREGATIONS) or time not in self.TIMES:
+            if "time_response" not in self.df.columns:
+                self.compute_times_df()
+            return self.df.groupby("message").agg({time:value})
 
+        self._aggregate()
+        if value == "mean":
+            values = self._by_message[(time, "sum")] / self._by_message[(time, "count")]
+        else:
+            values = self._by_message[(time, value)]
+        return values.to_frame(time)
 
     def average_loop_response(self,time_loops):
         """
         No hay chequeo de la existencia del loop: user responsability
         """
-        if "time_response" not in self.df.columns:
-            self.compute_times_df()
+        means = self.times(Metrics.TIME_TOTAL_RESPONSE)[Metrics.TIME_TOTAL_RESPONSE]
+        loops = [(i, msg) for i, loop in enumerate(time_loops) for msg in loop]
+        if not loops:
+            return [0.0] * len(time_loops)
+        idx, messages = zip(*loops)
+        # A message without records adds 0
+        values = pd.Series(means.reindex(list(messages)).fillna(0.0).values, index=idx)
+        return values.groupby(level=0).sum().reindex(range(len(time_loops)), fill_value=0.0).tolist()
+
+    def request_latencies(self, time_loops=None):
+        """
+        It reconstructs each request from the records with the same message id.
 
-        resp_msg = self.df.groupby("message").agg({"time_total_response": ["mean","count"]}) #Its not necessary to have "count"
-        resp_msg.columns = ['_'.join(col).strip() for col in resp_msg.columns.values]
-        results = []
+        Kwargs:
+            time_loops (list): a list of loops (lists of message names). By default, the full chain of each request
 
-        for loop in time_loops:
-            total = 0.0
-            for msg in loop:
-                try:
-                    total += resp_msg[resp_msg.index == msg].time_total_response_mean[0]
-                except IndexError:
-                    total +=0
+        Returns:
+            a *pandas.DataFrame* with one row by request (and loop): loop, app, id, start, end and latency.
+            Without loops, the latency goes from the emission of the request to the last output of any module; with loops, from the emission of the first message to the output of the last one. Unfinished requests are not included.
+        """
+        df = self.df[self.df.type.isin(self.REQUEST_TYPES)].sort_values("id", kind="stable")
+        if time_loops is None:
+            requests = df.groupby(["app", "id"], sort=False).agg(start=("time_emit", "min"), end=("time_out", "max"))
+            requests = requests.reset_index()
+            requests.insert(0, "loop", -1)
+        else:
+            frames = []
+            for i, loop in enumerate(time_loops):
+                if not loop:
+                    continue
+                first = df[df.message == loop[0]].groupby(["app", "id"], sort=False).time_emit.min()
+                last = df[df.message == loop[-1]].groupby(["app", "id"], sort=False).time_out.max()
+                requests = pd.concat([first.rename("start"), last.rename("end")], axis=1, join="inner").reset_index()
+                requests.insert(0, "loop", i)
+                frames.append(requests)
+            if not frames:
+                return pd.DataFrame(columns=self.COLUMNS_REQUEST)
+            requests = pd.concat(frames, ignore_index=True)
+        requests["latency"] = requests.end - requests.start
+        return requests
+
+    def end_to_end_latency(self, time_loops=None, deadlines=None, quantiles=(0.5, 0.95, 0.99, 0.999)):
+        """
+        The distribution of the end-to-end latency of the requests (see :func:`request_latencies`).
 
-            results.append(total)
+        Kwargs:
+            time_loops (list): a list of loops. By default, the full chain of the requests of each app
 
-        return results
+            deadlines (dict): app name -> deadline, i.e. from :func:`read_deadlines`
+
+            quantiles (list): the percentiles of the report
+
+        Returns:
+            a *pandas.DataFrame* indexed by app (or by loop) with: count, mean, max, one column for each percentile (p50, p95, ...) and, with deadlines, the deadline and the rate of requests that violate it
+        """
+        requests = self.request_latencies(time_loops)
+        key = "app" if time_loops is None else "loop"
+        groups = requests.groupby(key).latency
+        report = groups.agg(["count", "mean", "max"])
+        for q in quantiles:
+            report["p%g" % (q * 100)] = groups.quantile(q)
+        if time_loops is not None:
+            report.insert(0, "app", requests.groupby("loop").app.first())
+
+        if deadlines is not None:
+            deadline = requests.app.astype(str).map(deadlines)
+            requests["violation"] = requests.latency > deadline
+            report["deadline"] = requests.groupby(key).app.first().astype(str).map(deadlines)
+            report["violations"] = requests.groupby(key).violation.mean()
+        return report
 
     def get_watt(self,totaltime,topology,by=Metrics.WATT_SERVICE):
         results = {}
         nodeInfo = topology.get_info()
         if by == Metrics.WATT_SERVICE:
             # Tiempo de actividad / runeo
-            if "time_response" not in self.df.columns:  # cached
-                self.compute_times_df()
-
-            nodes = self.df.groupby("TOPO.dst").agg({"time_service": "sum"})
-            for id_node in nodes.index:
+            self._aggregate()
+            for id_node, time_service in self._by_node.items():
                 results[id_node] = {"model": nodeInfo[id_node]["model"], "type": nodeInfo[id_node]["type"],
-                                 "watt": nodes.loc[id_node].time_service * nodeInfo[id_node]["WATT"]}
+                                 "watt": time_service * nodeInfo[id_node]["WATT"]}
         else:
             for node_key in nodeInfo:
                 if not nodeInfo[node_key]["uptime"][1]:
@@ -165,18 +383,145 @@ class Stats:
         return self.df_link.buffer[-1:]
 
     def get_df_modules(self):
-        g = self.df.groupby(["module", "DES.dst"]).agg({"service": ['mean', 'sum', 'count']})
+        self._aggregate()
+        g = self._by_module.copy()
+        g["mean"] = g["sum"] / g["count"]
+        g = g[["mean", "sum", "count"]]
+        g.columns = pd.MultiIndex.from_product([["service"], g.columns])
         return g.reset_index()
 
     def get_df_service_utilization(self,service,time):
         """
         Returns the utilization(%) of a specific module
         """
-        g = self.df.groupby(["module", "DES.dst"]).agg({"service": ['mean', 'sum', 'count']})
-        g.reset_index(inplace=True)
+        g = self.get_df_modules()
         h = pd.DataFrame()
         h["module"] = g[g.module == service].module
         h["utilization"] = g[g.module == service]["service"]["sum"]*100 / time
         return h
 
 
+
+
+class StreamingStats(Stats):
+    """
+    The same reports of :class:`Stats` computed in one pass over the result files, chunk by chunk, with only the needed columns.
+    The dataframes are never fully loaded: the memory depends on the number of messages, modules and nodes, not on the length of the simulation.
+
+    Kwargs:
+        defaultPath (str): path of the result files without extension
+
+        format (str): Metrics.FORMAT_CSV or Metrics.FORMAT_NPY
+
+        chunksize (int): number of CSV rows of each chunk. The npy files are read by their blocks
+    """
+
+    COLUMNS_EVENT = ["message", "module", "DES.dst", "TOPO.dst", "service", "time_in", "time_out", "time_emit",
+                     "time_reception"]
+    COLUMNS_LINK = ["size", "buffer"]
+    COLUMNS_REQUEST_EVENT = ["id", "type", "app", "message", "time_emit", "time_out"]
+    DTYPES = {"type": str, "message": str, "module": str, "service": np.float64, "time_in": np.float64, "time_out": np.float64,
+              "time_emit": np.float64, "time_reception": np.float64, "buffer": np.float64}
+    # The size is not hinted: it is read as int64, as Stats does, unless the messages have float sizes
+
+    def __init__(self, defaultPath="result", format=Metrics.FORMAT_CSV, chunksize=1000000):
+        self.__path = defaultPath
+        self.__format = format
+        self.__chunksize = chunksize
+
+        self._by_message = None
+        self._by_des = None
+        self._by_node = None
+        self._by_module = None
+        for chunk in self.__chunks(defaultPath, "", self.COLUMNS_EVENT, format, chunksize):
+            self._add_events(chunk)
+        self._aggregated = True
+
+        self.__bytes = 0
+        self.__count_links = 0
+        self.__buffer_sum = 0.0
+        self.__buffer_max = np.nan
+        self.__buffer_last = np.nan
+        for chunk in self.__chunks(defaultPath, "_link", self.COLUMNS_LINK, format, chunksize):
+            self.__add_links(chunk)
+
+    def __chunks(self, path, suffix, columns, format, chunksize):
+        if format == Metrics.FORMAT_NPY:
+            return iter_columnar(path + suffix + ".npy", columns)
+        dtype = {c: self.DTYPES[c] for c in columns if c in self.DTYPES}
+        return pd.read_csv(path + suffix + ".csv", usecols=columns, dtype=dtype, chunksize=chunksize)
+
+    def __add_links(self, chunk):
+        if len(chunk) == 0:
+            return
+        self.__bytes += chunk["size"].sum()
+        self.__count_links += len(chunk)
+        self.__buffer_sum += chunk["buffer"].sum()
+        self.__buffer_max = np.nanmax([self.__buffer_max, chunk["buffer"].max()])
+        self.__buffer_last = chunk["buffer"].iloc[-1]
+
+    def bytes_transmitted(self):
+        return self.__bytes
+
+    def count_messages(self):
+        return self.__count_links
+
+    def compute_times_df(self):
+        """
+        The times are computed while the files are read
+        """
+
+    def times(self, time, value="mean"):
+        if value not in ("mean",) + tuple(self.AGGREGATIONS) or time not in self.TIMES:
+            raise ValueError("StreamingStats only aggregates %s of %s" % (("mean",) + tuple(self.AGGREGATIONS), self.TIMES))
+        return super(StreamingStats, self).times(time, value)
+
+    def request_latencies(self, time_loops=None):
+        """
+        The same result of :func:`Stats.request_latencies`. The event file is read again, chunk by chunk: the start and the end of each request of a chunk are combined with the ones of the requests that are still open from the previous chunks.
+        The memory depends on the number of requests, not on the number of records.
+        """
+        if time_loops is None:
+            loops = [(-1, None)]
+        else:
+            loops = [(i, loop) for i, loop in enumerate(time_loops) if loop]
+        starts = {i: None for i, loop in loops}
+        ends = {i: None for i, loop in loops}
+        # loop -> (app, id) -> time
+        for chunk in self.__chunks(self.__path, "", self.COLUMNS_REQUEST_EVENT, self.__format, self.__chunksize):
+            chunk = chunk[chunk.type.isin(self.REQUEST_TYPES)]
+            if len(chunk) == 0:
+                continue
+            for i, loop in loops:
+                first = chunk if loop is None else chunk[chunk.message == loop[0]]
+                last = chunk if loop is None else chunk[chunk.message == loop[-1]]
+                starts[i] = self._merge(starts[i], first.groupby(["app", "id"]).time_emit.min(), "min")
+                ends[i] = self._merge(ends[i], last.groupby(["app", "id"]).time_out.max(), "max")
+
+        frames = []
+        for i, loop in loops:
+            if starts[i] is None:
+                continue
+            requests = pd.concat([starts[i].rename("start"), ends[i].rename("end")], axis=1, join="inner").reset_index()
+            requests = requests.sort_values("id", kind="stable", ignore_index=True)
+            requests.insert(0, "loop", i)
+            frames.append(requests)
+        if not frames:
+            return pd.DataFrame(columns=self.COLUMNS_REQUEST)
+        requests = pd.concat(frames, ignore_index=True)
+        requests["latency"] = requests.end - requests.start
+        return requests
+
+    def average_messages_not_transmitted(self):
+        return self.__buffer_sum / self.__count_links
+
+    def peak_messages_not_transmitted(self):
+        return self.__buffer_max
+
+    def messages_not_transmitted(self):
+        """
+        The same type of :class:`Stats`: a *pandas.Series* with the buffer of the last link record, empty without records
+        """
+        if self.__count_links == 0:
+            return pd.Series([], dtype=np.float64, name="buffer")
+        return pd.Series([self.__buffer_last], index=[self.__count_links - 1], name="buffer")
@@ -5,10 +5,14 @@ import logging
 import networkx as nx
 import warnings
 
+from yafs.routing_table import RoutingTable
+
 
 class Topology:
     """
     This class unifies the functions to deal with **Complex Networks** as a network topology within of the simulator. In addition, it facilitates its creation, and assignment of attributes.
+
+    .. note:: The latencies of the links (see *get_link_table*) and the shortest paths (see *get_routing_table*) are compiled from *G*. They are rebuilt when *G* is replaced and they are updated by the functions of this class, but they do not see the changes made directly in *G*: after modifying the edges or their attributes in place, *invalidate_link_table* and *get_routing_table().clear()* have to be invoked.
     """
 
     LINK_BW = "BW"
@@ -32,8 +36,85 @@ class Topology:
         self.nodeAttributes = {}
         self.logger = logger or logging.getLogger(__name__)
 
+        self.__link_index = None
+        # Compiled link table, see get_link_table
+        self.__link_graph = None
+        # the graph from which the link table was compiled
+        # (src, dst) and (dst, src) -> edge index in __link_bw and __link_pr
+        self.__link_bw = []
+        self.__link_pr = []
+
+        self.__latency_cache = {}
+        # (link, message.bytes) -> transmission + propagation time
+
+        self.__routing_table = None
+        # Shortest paths shared by the selection algorithms, see get_routing_table
+
+
+
+
+    def invalidate_link_table(self):
+        """
+        Discards the compiled link table and the latency memo. It is called whenever the graph changes.
+        If the user modifies the edges of *G* in place, this function has to be invoked afterwards. A replaced *G* is detected by *get_link_table*.
+        """
+        self.__link_index = None
+        self.__link_graph = None
+        self.__link_bw = []
+        self.__link_pr = []
+        self.__latency_cache = {}
+
+    def get_routing_table(self):
+        """
+        Returns:
+            the (:mod:`RoutingTable`) of the current graph. It is updated by *add_node* and *remove_node*, and it is created again if *G* is replaced.
+            If the user modifies the edges of *G* directly, *get_routing_table().clear()* has to be invoked afterwards.
+        """
+        if self.__routing_table is None or self.__routing_table.G is not self.G:
+            self.__routing_table = RoutingTable(self.G)
+        return self.__routing_table
+
+    def get_link_table(self):
+        """
+        The link table is built once from the edges of *G* and it is reused until the graph changes. It is built again if *G* is replaced.
+
+        Returns:
+            a tuple (index, bw, pr): a dict from link (both directions) to edge index, and two lists with the BW and PR of each edge index
+        """
+        if self.__link_index is None or self.__link_graph is not self.G:
+            self.invalidate_link_table()
+            self.__link_graph = self.G
+            self.__link_index = {}
+            for idx, (src, dst, att) in enumerate(self.G.edges(data=True)):
+                self.__link_index[(src, dst)] = idx
+                self.__link_index[(dst, src)] = idx
+                self.__link_bw.append(att[self.LINK_BW])
+                self.__link_pr.append(att[self.LINK_PR])
+        return self.__link_index, self.__link_bw, self.__link_pr
+
+    def get_link_latency(self, link, size):
+        """
+        Args:
+            link (tuple): a edge identifier, i.e. (1,9)
+
+            size (int): the size of the message in bytes
 
+        Returns:
+            float: the transmission plus the propagation time of the message on the link
 
+        Raises:
+            KeyError: the link is not in the topology
+        """
+        if self.__link_graph is not self.G:
+            self.invalidate_link_table()
+        try:
+            return self.__latency_cache[link, size]
+        except KeyError:
+            index, bw, pr = self.get_link_table()
+            idx = index[link]
+            latency = size / bw[idx] + pr[idx]
+            self.__latency_cache[link, size] = latency
+            return latency
 
     def __init_uptimes(self):
         for key in self.nodeAttributes:
@@ -86,6 +167,7 @@ class Topology:
         """
         if isinstance(G, nx.classes.graph.Graph):
             self.G = G
+            self.invalidate_link_table()
         else:
             raise TypeError
 
@@ -101,6 +183,7 @@ class Topology:
         """
         try:
             self.G = nxGraphGenerator(*params)
+            self.invalidate_link_table()
         except:
             raise Exception
 
@@ -119,6 +202,7 @@ class Topology:
         self.G = nx.Graph()
         for edge in data["link"]:
             self.G.add_edge(edge["s"], edge["d"], BW=edge[self.LINK_BW],PR=edge[self.LINK_PR])
+        self.invalidate_link_table()
 
 
         #TODO This part can be removed in next versions
@@ -150,6 +234,7 @@ class Topology:
         self.G = nx.Graph()
         for edge in data["link"]:
             self.G.add_edge(edge["s"], edge["d"], BW=edge[self.LINK_BW], PR=edge[self.LINK_PR])
+        self.invalidate_link_table()
 
         dc = {str(x): {} for x in data["entity"][0].keys()}
         for ent in data["entity"]:
@@ -180,6 +265,7 @@ class Topology:
         for k in self.G.edges():
             attEdges[k] = {"BW": 1, "PR": 1}
         nx.set_edge_attributes(self.G, values=attEdges)
+        self.invalidate_link_table()
         attNodes = {}
         for k in self.G.nodes():
             attNodes[k] = {"IPT": 1}
@@ -235,6 +321,9 @@ class Topology:
         self.__idNode = + 1
         self.G.add_node(self.__idNode)
         self.G.add_edges_from(zip(nodes, [self.__idNode] * len(nodes)))
+        self.invalidate_link_table()
+        if self.__routing_table is not None:
+            self.__routing_table.add_node(self.__idNode)
 
         return self.__idNode
 
@@ -247,6 +336,44 @@ class Topology:
         """
 
         self.G.remove_node(id_node)
+        self.invalidate_link_table()
+        if self.__routing_table is not None:
+            self.__routing_table.remove_node(id_node)
         return self.size()
 
+    def add_edge(self, src, dst, BW, PR):
+        """
+        Add a link in the topology
+
+        Args:
+            src (int): node identifier
+
+            dst (int): node identifier
+
+            BW (float): bandwidth
+
+            PR (float): propagation delay
+        """
+        self.G.add_edge(src, dst, **{self.LINK_BW: BW, self.LINK_PR: PR})
+        self.invalidate_link_table()
+        if self.__routing_table is not None:
+            self.__routing_table.add_edge(src, dst)
+
+    def remove_edge(self, src, dst):
+        """
+        Remove a link of the topology
+
+        Args:
+            src (int): node identifier
+
+            dst (int): node identifier
+        """
+        self.G.remove_edge(src, dst)
+        self.invalidate_link_table()
+        if self.__routing_table is not None:
+            self.__routing_table.remove_edge(src, dst)
+
+    def write(self, path):
+        nx.write_gexf(self.G, path)
+
 
@@ -0,0 +1,73 @@
+"""
+    An event trace keeps the last events of the simulation in a ring buffer of fixed size, a binary record for each event.
+
+    It is an alternative to the DEBUG logs for long simulations: the cost of each event is a row assignment, and the last events can be dumped when something goes wrong.
+
+    .. code-block:: python
+
+        trace = EventTrace(capacity=100000)
+        s = Sim(t, trace=trace)
+        ...
+        trace.dump("last_events.npy")
+
+"""
+import numpy as np
+
+
+class EventTrace(object):
+    """
+    Args:
+        capacity (int): the number of events that are kept, the oldest ones are overwritten
+
+    The fields of each event are *time*, *kind* (see the KIND_ constants), *id* (of the message), *DES* and two values *a* and *b* that depend on the kind:
+
+        KIND_SEND: the DES that sends, the first DES of destination and the number of paths
+
+        KIND_LINK: the DES of destination and the link (a, b)
+
+        KIND_DELIVER: the DES of destination and the node where it is delivered
+
+        KIND_DROP: the DES of destination and the link (a, b) where the message is dropped
+
+        KIND_LOST: the DES of destination and the node where the message is lost
+    """
+
+    KIND_SEND = 0
+    KIND_LINK = 1
+    KIND_DELIVER = 2
+    KIND_DROP = 3
+    KIND_LOST = 4
+
+    KINDS = ["send", "link", "deliver", "drop", "lost"]
+
+    DTYPE = np.dtype([("time", np.float64), ("kind", np.int8), ("id", np.int64),
+                      ("DES", np.int32), ("a", np.int64), ("b", np.int64)])
+
+    def __init__(self, capacity=100000):
+        self.capacity = capacity
+        self.events = np.zeros(capacity, dtype=self.DTYPE)
+        self.count = 0
+        # number of recorded events, including the overwritten ones
+
+    def record(self, time, kind, id, DES, a=-1, b=-1):
+        self.events[self.count % self.capacity] = (time, kind, id, -1 if DES is None else DES, a, b)
+        self.count += 1
+
+    def get_events(self):
+        """
+        Returns:
+            a numpy structured array with the kept events, from the oldest to the newest
+        """
+        if self.count <= self.capacity:
+            return self.events[:self.count].copy()
+        start = self.count % self.capacity
+        return np.concatenate((self.events[start:], self.events[:start]))
+
+    def dump(self, path):
+        """
+        Saves the kept events in a *.npy* file
+        """
+        np.save(path, self.get_events())
+
+    def clear(self):
+        self.count = 0